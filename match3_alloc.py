@@ -0,0 +1,227 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from match3_board import Match3Board
+from match3_game import Match3Game
+
+
+class Match3AllocHarness:
+    hot_functions = (
+        "get_group",
+        "filter_group",
+        "populate",
+        "find_a_play",
+        "count_plays",
+        "reshuffle",
+        "collapse",
+        "get_valid_groups",
+    )
+    budgets_filename = "alloc_budgets.json"
+    default_tolerance = 0.1
+    default_cascades = 10000
+    # A quick check autoplays the start of the same sessions, its peaks are compared against the full budgets
+    quick_cascades = 1000
+
+    def __init__(self, size: int = 9, cascades: int = default_cascades, seed: int = 0) -> None:
+        self.size = size
+        self.cascades = cascades
+        self.seed = seed
+        self.stats = {name: {"calls": 0, "total_peak": 0, "max_peak": 0} for name in self.hot_functions}
+        self.session_peak = 0
+        self.num_cascades = 0
+        self.num_moves = 0
+        self.num_regenerations = 0
+        self.depth = {name: 0 for name in self.hot_functions}
+        self.frames = list()
+
+    def instrument(self, board: Match3Board) -> None:
+        # Wrap the hot functions of this board instance only, so that nested calls (e.g. the filter_group calls made
+        # by populate) are measured too. Recursive calls of the same function are accounted to the outermost one.
+        for name in self.hot_functions:
+            setattr(board, name, self.wrap(name, getattr(board, name)))
+
+    def wrap(self, name: str, func):
+        stats = self.stats[name]
+
+        def wrapper(*args, **kwargs):
+            if self.depth[name] > 0:
+                return func(*args, **kwargs)
+            # Resetting the tracemalloc peak hides the peak reached so far by the enclosing call, save it in the
+            # enclosing call frame first.
+            current, peak = tracemalloc.get_traced_memory()
+            if len(self.frames) > 0:
+                self.frames[-1][1] = max(self.frames[-1][1], peak)
+            self.session_peak = max(self.session_peak, peak)
+            tracemalloc.reset_peak()
+            self.frames.append([current, 0])
+            self.depth[name] += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depth[name] -= 1
+                peak = tracemalloc.get_traced_memory()[1]
+                (start, nested_peak) = self.frames.pop()
+                if len(self.frames) > 0:
+                    self.frames[-1][1] = max(self.frames[-1][1], peak)
+                op_peak = max(peak, nested_peak) - start
+                stats["calls"] += 1
+                stats["total_peak"] += op_peak
+                stats["max_peak"] = max(stats["max_peak"], op_peak)
+
+        return wrapper
+
+    def autoplay(self) -> None:
+        # Same board flow as Match3GUI.running(), without any rendering.
+        board = Match3Board(self.size, self.size, Match3Game.num_values_for_size(self.size))
+        self.instrument(board)
+        while self.num_cascades < self.cascades:
+            play = board.find_a_play()
+            if len(play) > 0:
+                (swap_points, _) = play
+                board.swap(*swap_points)
+                self.num_moves += 1
+            groups = board.get_valid_groups()
+            while len(groups) > 0:
+                points = [point for group in groups for point in group]
+                board.clear(points)
+                board.collapse()
+                groups = board.get_valid_groups()
+                self.num_cascades += 1
+            if board.count_plays() == 0:
+                if len(board.reshuffle()) == 0:
+                    board.clear()
+                    board.populate()
+                self.num_regenerations += 1
+
+    def run(self) -> dict:
+        # The session peak must not depend on the sessions run before in the process: autoplay a few cascades untraced
+        # first so the one-time allocations aren't charged to the session, then empty the free lists (a full collection
+        # does) since the objects taken from them are not seen by tracemalloc
+        Match3AllocHarness(self.size, 10, self.seed).autoplay()
+        gc.collect()
+        random.seed(self.seed)
+        tracemalloc.start()
+        time_start = time.perf_counter()
+        try:
+            self.autoplay()
+            self.session_peak = max(self.session_peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        elapsed = time.perf_counter() - time_start
+        result = {
+            "size": self.size,
+            "cascades": self.num_cascades,
+            "moves": self.num_moves,
+            "regenerations": self.num_regenerations,
+            "elapsed": elapsed,
+            "session_peak": self.session_peak,
+            "functions": {},
+        }
+        for name, stats in self.stats.items():
+            if stats["calls"] == 0:
+                continue
+            result["functions"][name] = {
+                "calls": stats["calls"],
+                "avg_peak": stats["total_peak"] / stats["calls"],
+                "max_peak": stats["max_peak"],
+            }
+        return result
+
+    @staticmethod
+    def report(result: dict) -> str:
+        lines = [
+            f"Board {result['size']}x{result['size']}: {result['cascades']} cascades, {result['moves']} moves, "
+            f"{result['regenerations']} regenerations in {result['elapsed']:.2f}s (traced)",
+            f"Session peak: {result['session_peak']} B",
+            f"{'Function':<18}{'Calls':>10}{'Avg peak (B)':>15}{'Max peak (B)':>15}",
+        ]
+        for name, stats in result["functions"].items():
+            lines.append(f"{name:<18}{stats['calls']:>10}{stats['avg_peak']:>15.1f}{stats['max_peak']:>15}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def check(result: dict, budget: dict, tolerance: float, keys: tuple[str, ...] = ("avg_peak", "max_peak")) -> list[str]:
+        errors = list()
+        limit = budget["session_peak"] * (1 + tolerance)
+        if result["session_peak"] > limit:
+            errors.append(f"session_peak: {result['session_peak']} B > {limit:.0f} B")
+        for name, func_budget in budget["functions"].items():
+            if name not in result["functions"]:
+                continue
+            for key in keys:
+                limit = func_budget[key] * (1 + tolerance)
+                if result["functions"][name][key] > limit:
+                    errors.append(f"{name}.{key}: {result['functions'][name][key]:.1f} B > {limit:.1f} B")
+        return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Allocation budget check for the Match3Board hot loops. The budgets are the peak memory (bytes) "
+                    "allocated per call and per session, measured with tracemalloc, not numbers of allocations.")
+    parser.add_argument("--size", type=int, nargs="+", default=[5, 9, 13], help="board sizes to autoplay")
+    parser.add_argument("--cascades", type=int, default=Match3AllocHarness.default_cascades,
+                        help="number of cascades per board size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budgets", default=Match3AllocHarness.budgets_filename, help="budgets file")
+    parser.add_argument("--tolerance", type=float, default=Match3AllocHarness.default_tolerance,
+                        help="allowed relative overshoot over the recorded budgets")
+    parser.add_argument("--record", action="store_true", help="record the measured values as the new budgets")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"autoplay only the first {Match3AllocHarness.quick_cascades} cascades of each session")
+    args = parser.parse_args()
+    if args.quick:
+        if args.record:
+            parser.error("The budgets must be recorded from full sessions, --quick can't be used with --record.")
+        args.cascades = Match3AllocHarness.quick_cascades
+
+    budgets = dict()
+    try:
+        with open(args.budgets, 'r') as f:
+            budgets = json.load(f)
+    except FileNotFoundError:
+        pass
+
+    failed = False
+    for size in args.size:
+        result = Match3AllocHarness(size, args.cascades, args.seed).run()
+        print(Match3AllocHarness.report(result))
+        key = f"{size}x{size}"
+        if args.record:
+            budgets[key] = {
+                "cascades": args.cascades,
+                "seed": args.seed,
+                "session_peak": result["session_peak"],
+                "functions": {
+                    name: {"avg_peak": round(stats["avg_peak"], 1), "max_peak": stats["max_peak"]}
+                    for name, stats in result["functions"].items()
+                },
+            }
+        elif key in budgets:
+            if (budgets[key].get("cascades") != args.cascades and not args.quick) or budgets[key].get("seed") != args.seed:
+                print(f"WARNING: Budget for {key} was recorded with a different number of cascades or seed.")
+            # A quick session is the start of a full one, its peaks can't be higher but the averages of the functions
+            # rarely called (e.g. reshuffle) are taken over too few calls to be compared
+            keys = ("max_peak",) if args.quick else ("avg_peak", "max_peak")
+            errors = Match3AllocHarness.check(result, budgets[key], args.tolerance, keys)
+            for error in errors:
+                print(f"OVER BUDGET: {key} {error}")
+            failed = failed or len(errors) > 0
+        else:
+            print(f"WARNING: No budget recorded for {key}.")
+        print()
+
+    if args.record:
+        with open(args.budgets, 'w') as f:
+            json.dump(budgets, f, indent=4)
+            f.write("\n")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from match3_board import Match3Board
+from match3_game import Match3Game
+
+
+class Match3Analytics:
+    # Simulated player time (ms) spent per move and per cascade step (clear and fall animations of the GUI)
+    move_time = 1500
+    cascade_step_time = 400
+    # Sessions are cut at this number of moves, with few values the time bonuses can keep a game going forever
+    max_moves = 2000
+    cache_filename = "analytics_cache.json"
+
+    def __init__(self, size: int = 7, num_values: int = None, boards: int = 200, sessions: int = 20, seed: int = 0,
+                 time_init: int = Match3Game.time_init) -> None:
+        self.size = size
+        self.num_values = num_values if num_values is not None else Match3Game.num_values_for_size(size)
+        self.boards = boards
+        self.sessions = sessions
+        self.seed = seed
+        self.time_init = time_init
+
+    @staticmethod
+    def key(size: int, num_values: int) -> str:
+        return f"{size}x{size}/{num_values}"
+
+    def params(self) -> dict:
+        # Everything a cached result depends on, a result is only reused if these are the same
+        return {
+            "boards": self.boards,
+            "sessions": self.sessions,
+            "seed": self.seed,
+            "time_init": self.time_init,
+            "move_time": self.move_time,
+            "cascade_step_time": self.cascade_step_time,
+            "max_moves": self.max_moves,
+        }
+
+    def new_board(self, rand: random.Random) -> Match3Board:
+        return Match3Board(self.size, self.size, self.num_values, rand.getrandbits(64))
+
+    def sample_boards(self, rand: random.Random) -> dict:
+        # Generation cost and number of plays of freshly generated boards
+        times = list()
+        plays = list()
+        failed = 0
+        for _ in range(self.boards):
+            time_start = time.perf_counter()
+            try:
+                board = self.new_board(rand)
+            except RuntimeError:
+                failed += 1
+                continue
+            times.append((time.perf_counter() - time_start) * 1000)
+            plays.append(board.count_plays())
+        return {"times": times, "plays": plays, "failed": failed}
+
+    def autoplay(self, rand: random.Random) -> dict:
+        # Play the first play found until the time runs out, the game time is simulated instead of measured
+        game = Match3Game(self.size, self.time_init, board=self.new_board(rand))
+        time_elapsed = 0
+        depths = list()
+        plays = list()
+        while Match3Game.calc_time_left(game.time_init, game.time_score, time_elapsed) > 0 and game.num_moves < self.max_moves:
+            plays.append(game.board.count_plays())
+            (swap_points, _) = game.board.find_a_play()
+            result = game.swap(*swap_points)
+            depths.append(result["depth"])
+            time_elapsed += self.move_time + result["depth"] * self.cascade_step_time
+        return {
+            "score": game.score,
+            "time": time_elapsed,
+            "moves": game.num_moves,
+            "regenerations": game.num_regenerations,
+            "depths": depths,
+            "plays": plays,
+            "capped": game.num_moves >= self.max_moves,
+        }
+
+    def run(self) -> dict:
+        rand = random.Random(f"{self.seed}-{self.size}-{self.num_values}")
+        time_start = time.perf_counter()
+        boards = self.sample_boards(rand)
+        sessions = list()
+        if len(boards["times"]) > 0:
+            for _ in range(self.sessions):
+                try:
+                    sessions.append(self.autoplay(rand))
+                except RuntimeError:
+                    pass
+        depths = [depth for session in sessions for depth in session["depths"]]
+        plays = [num_plays for session in sessions for num_plays in session["plays"]]
+        num_moves = sum(session["moves"] for session in sessions)
+        total_time = sum(session["time"] for session in sessions)
+        return {
+            "size": self.size,
+            "num_values": self.num_values,
+            "params": self.params(),
+            "generation_ms": statistics.mean(boards["times"]) if len(boards["times"]) > 0 else None,
+            "generation_max_ms": max(boards["times"]) if len(boards["times"]) > 0 else None,
+            "generation_failures": boards["failed"] / self.boards,
+            "initial_plays": statistics.mean(boards["plays"]) if len(boards["plays"]) > 0 else None,
+            "plays": statistics.mean(plays) if len(plays) > 0 else None,
+            "dead_boards": sum(session["regenerations"] for session in sessions) / num_moves if num_moves > 0 else None,
+            "cascade_depth": statistics.mean(depths) if len(depths) > 0 else None,
+            "max_cascade_depth": max(depths) if len(depths) > 0 else None,
+            "points_per_second": sum(session["score"] for session in sessions) / total_time * 1000 if total_time > 0 else None,
+            "session_time": total_time / len(sessions) / 1000 if len(sessions) > 0 else None,
+            "capped_sessions": sum(session["capped"] for session in sessions),
+            "elapsed": time.perf_counter() - time_start,
+        }
+
+    @staticmethod
+    def run_job(size: int, num_values: int, boards: int, sessions: int, seed: int, time_init: int) -> dict:
+        return Match3Analytics(size, num_values, boards, sessions, seed, time_init).run()
+
+    @staticmethod
+    def valid_num_values(size: int) -> list[int]:
+        # Same limits as the Match3Board constructor
+        return [num_values for num_values in range(2, size) if num_values**2 < size * size]
+
+    @staticmethod
+    def report(results: list[dict]) -> str:
+        def fmt(value, spec: str) -> str:
+            return "-" if value is None else format(value, spec)
+
+        lines = [
+            f"{'Size':<8}{'Values':>7}{'Gen (ms)':>10}{'Gen fail':>10}{'Plays':>8}{'Dead':>8}{'Depth':>8}{'Pts/s':>8}{'Game (s)':>10}"
+        ]
+        for result in results:
+            label = f"{result['size']}x{result['size']}"
+            if result["num_values"] == Match3Game.num_values_for_size(result["size"]):
+                label += "*"
+            lines.append(
+                f"{label:<8}{result['num_values']:>7}"
+                f"{fmt(result['generation_ms'], '.3f'):>10}{fmt(result['generation_failures'], '.1%'):>10}"
+                f"{fmt(result['plays'], '.1f'):>8}{fmt(result['dead_boards'], '.2%'):>8}"
+                f"{fmt(result['cascade_depth'], '.2f'):>8}{fmt(result['points_per_second'], '.2f'):>8}"
+                f"{fmt(result['session_time'], '.1f'):>10}{'+' if result['capped_sessions'] > 0 else ''}"
+            )
+        lines.append("* number of values used by the game, + some sessions were cut at the maximum number of moves")
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sample boards and autoplay sessions per board size and number of values.")
+    parser.add_argument("--size", type=int, nargs="+", default=Match3Game.board_sizes, help="board sizes to analyze")
+    parser.add_argument("--values", type=int, nargs="+",
+                        help="numbers of values to analyze (default: the one used by the game and its neighbors)")
+    parser.add_argument("--all-values", action="store_true", help="analyze every valid number of values of each size")
+    parser.add_argument("--boards", type=int, default=200, help="number of boards generated per setting")
+    parser.add_argument("--sessions", type=int, default=20, help="number of autoplayed sessions per setting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time", type=int, default=Match3Game.time_init, help="initial game time (ms)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--cache", default=Match3Analytics.cache_filename, help="results cache file")
+    parser.add_argument("--no-cache", action="store_true", help="recompute every setting, the cache is still updated")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    settings = list()
+    for size in args.size:
+        if size not in Match3Game.board_sizes:
+            parser.error(f"Board size must be between {Match3Game.board_sizes[0]} and {Match3Game.board_sizes[-1]}.")
+        valid = Match3Analytics.valid_num_values(size)
+        if args.all_values:
+            values = valid
+        elif args.values is not None:
+            values = [num_values for num_values in args.values if num_values in valid]
+        else:
+            default = Match3Game.num_values_for_size(size)
+            values = [num_values for num_values in (default - 1, default, default + 1) if num_values in valid]
+        settings += [(size, num_values) for num_values in values]
+
+    cache = dict()
+    try:
+        with open(args.cache, 'r') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        pass
+
+    # Only the settings without a cached result for the same parameters are computed
+    params = Match3Analytics(boards=args.boards, sessions=args.sessions, seed=args.seed, time_init=args.time).params()
+    pending = [
+        (size, num_values) for (size, num_values) in settings
+        if args.no_cache or cache.get(Match3Analytics.key(size, num_values), {}).get("params") != params
+    ]
+    print(f"{len(settings) - len(pending)} cached, {len(pending)} to compute")
+    if len(pending) > 0:
+        with ProcessPoolExecutor(args.workers) as pool:
+            futures = [
+                pool.submit(Match3Analytics.run_job, size, num_values, args.boards, args.sessions, args.seed, args.time)
+                for (size, num_values) in pending
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                cache[Match3Analytics.key(result["size"], result["num_values"])] = result
+                print(f"{result['size']}x{result['size']} {result['num_values']} values: {result['elapsed']:.2f}s")
+                # Save after each result so an interrupted run keeps what it computed
+                with open(args.cache, 'w') as f:
+                    json.dump(cache, f, indent=4)
+                    f.write("\n")
+
+    results = [cache[Match3Analytics.key(size, num_values)] for (size, num_values) in settings]
+    print(Match3Analytics.report(results))
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
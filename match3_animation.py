@@ -0,0 +1,69 @@
+from typing import Callable
+
+
+class Tween:
+    def __init__(
+        self,
+        name: str,
+        duration: float,
+        on_update: Callable[[float], None] = None,
+        on_finish: Callable[[], None] = None,
+        points: list[tuple[int, int]] = (),
+        delay: float = 0,
+    ) -> None:
+        self.name = name
+        self.duration = duration
+        self.on_update = on_update
+        self.on_finish = on_finish
+        # Board points whose tiles are drawn by the tween instead of by the static board layer
+        self.points = tuple(points)
+        self.delay = delay
+        self.time_start = None
+        self.progress = 0
+
+    def update(self, now: int) -> bool:
+        if self.time_start is None:
+            self.time_start = now
+        elapsed = now - self.time_start - self.delay
+        if elapsed < 0:
+            return False
+        if self.duration <= 0:
+            self.progress = 1
+        else:
+            self.progress = min(elapsed / self.duration, 1)
+        if self.on_update is not None:
+            self.on_update(self.progress)
+        return self.progress >= 1
+
+
+class Timeline:
+    def __init__(self) -> None:
+        self.tweens = []
+
+    def add(self, tween: Tween) -> Tween:
+        self.tweens.append(tween)
+        return tween
+
+    def remove(self, tween: Tween) -> None:
+        if tween in self.tweens:
+            self.tweens.remove(tween)
+
+    def clear(self) -> None:
+        self.tweens = []
+
+    def busy(self) -> bool:
+        return len(self.tweens) > 0
+
+    def board_tweens(self) -> list[Tween]:
+        return [tween for tween in self.tweens if len(tween.points) > 0]
+
+    def board_busy(self) -> bool:
+        return len(self.board_tweens()) > 0
+
+    def advance(self, now: int) -> None:
+        # Update all the tweens first, the finish callbacks may add new tweens that must start in the next frame
+        finished = [tween for tween in list(self.tweens) if tween.update(now)]
+        for tween in finished:
+            self.remove(tween)
+            if tween.on_finish is not None:
+                tween.on_finish()
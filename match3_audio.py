@@ -0,0 +1,99 @@
+import os
+import time
+import pygame
+
+
+class Match3Audio:
+    frequency = 44100
+    buffer_size = 256
+    # Channels reserved for each category of effects, the effects of a category can't take the channels of another one
+    categories = {"board": 2, "cascade": 4, "timer": 1, "ui": 2}
+    # Category and minimum time (ms) between two plays of each effect
+    effects = {
+        "swap": ("board", 0),
+        "hint": ("board", 0),
+        "match": ("cascade", 60),
+        "drop": ("cascade", 60),
+        "beep": ("timer", 0),
+        "end": ("ui", 0),
+        "yay": ("ui", 0),
+    }
+    default_effect = ("ui", 0)
+    # Sounds loaded first by the background loader, they are played right after a user action
+    preload_sounds = ("swap", "match")
+
+    def __init__(self, sounds_dir: str, buffer_size: int = None) -> None:
+        self.sounds_dir = sounds_dir
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+        self.sound_files = {}
+        self.sounds = {}
+        self.channels = {}
+        self.channel_times = {}
+        self.last_play_times = {}
+        self.buffer_latency = 0
+
+    ##################################################
+    # Init
+    ##################################################
+
+    def pre_init(self) -> None:
+        # Must be called before pygame.init(), a smaller buffer lowers the latency of the effects
+        pygame.mixer.pre_init(self.frequency, -16, 2, self.buffer_size)
+
+    def init(self) -> None:
+        # Must be called after pygame.mixer.init(), the channels not reserved are left to pygame
+        num_reserved = sum(self.categories.values())
+        pygame.mixer.set_num_channels(pygame.mixer.get_num_channels() + num_reserved)
+        pygame.mixer.set_reserved(num_reserved)
+        index = 0
+        for category, num_channels in self.categories.items():
+            self.channels[category] = [pygame.mixer.Channel(index + i) for i in range(num_channels)]
+            self.channel_times[category] = [0] * num_channels
+            index += num_channels
+        # A sound is heard at the earliest after the buffer being mixed is played
+        self.buffer_latency = self.buffer_size / pygame.mixer.get_init()[0] * 1000
+        if os.path.isdir(self.sounds_dir):
+            for filename in os.listdir(self.sounds_dir):
+                sound_name = os.path.splitext(filename)[0]
+                self.sound_files[sound_name] = f"{self.sounds_dir}/{filename}"
+
+    ##################################################
+    # Sounds
+    ##################################################
+
+    def get_sound(self, sound: str) -> pygame.mixer.Sound:
+        # Load the sound now if the background loader hasn't got to it yet
+        if sound not in self.sounds:
+            self.sounds[sound] = pygame.mixer.Sound(self.sound_files[sound])
+        return self.sounds[sound]
+
+    def load(self) -> None:
+        # Runs in the audio loader thread, the preloaded sounds go first
+        for sound in sorted(self.sound_files, key=lambda sound: sound not in self.preload_sounds):
+            self.get_sound(sound)
+
+    def get_channel_index(self, category: str) -> int:
+        # A free channel of the category, or the one that has been playing the longest
+        channels = self.channels[category]
+        for i, channel in enumerate(channels):
+            if not channel.get_busy():
+                return i
+        times = self.channel_times[category]
+        return times.index(min(times))
+
+    def play(self, sound: str) -> float:
+        # Return an estimate of the time (ms) until the sound is heard, None if it wasn't played: the time to start it
+        # plus one mixer buffer, the device latency is unknown
+        if sound not in self.sound_files:
+            return None
+        (category, interval) = self.effects.get(sound, self.default_effect)
+        now = pygame.time.get_ticks()
+        if sound in self.last_play_times and now - self.last_play_times[sound] < interval:
+            return None
+        self.last_play_times[sound] = now
+        time_start = time.perf_counter()
+        i = self.get_channel_index(category)
+        self.channels[category][i].play(self.get_sound(sound))
+        self.channel_times[category][i] = now
+        return (time.perf_counter() - time_start) * 1000 + self.buffer_latency
@@ -0,0 +1,271 @@
+import os
+
+# The dummy drivers must be selected before pygame is initialized
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import random
+import statistics
+import time
+import pygame
+from match3_animation import Tween
+from match3_gui import Match3GUI, GameState
+
+
+class Match3BenchStop(Exception):
+    pass
+
+
+class Match3BenchClock:
+    # Stands in for pygame.time.Clock, every tick ends a frame of the main loop and starts the next one
+    def __init__(self, bench) -> None:
+        self.bench = bench
+        self.clock = bench.clock_class()
+
+    def tick(self, framerate: int = 0) -> int:
+        self.bench.frame_end()
+        result = self.clock.tick(framerate)
+        self.bench.frame_begin()
+        return result
+
+    def get_fps(self) -> float:
+        return self.clock.get_fps()
+
+
+class Match3Bench:
+    move_interval = 10
+    hint_interval = 5
+
+    def __init__(self, frames: int = 3000, size: int = 7, seed: int = 0, game_time: int = 20, events: list = None,
+                 render_size: tuple[int, int] = None) -> None:
+        self.frames = frames
+        self.size = size
+        self.seed = seed
+        self.gui = Match3GUI(render_size=render_size)
+        self.gui.time_init = game_time * 1000
+        # The scripted input is paced in frames, don't let the idle screens sleep between them
+        self.gui.idle_mode = False
+        self.gui.replays_dir = None
+        # The high scores of the benchmark games are kept in memory, the high scores file is not touched
+        self.gui.high_scores_db_filename = ":memory:"
+        # Recorded events to play back, if None the events are generated by script()
+        self.events = events
+        self.recorded = list()
+        self.frame = 0
+        self.frame_start = None
+        self.frame_state = None
+        self.frame_times = dict()
+        self.tween_times = dict()
+        self.next_action = 0
+        self.release = None
+        self.num_moves = 0
+        self.mouse_pos = (0, 0)
+        self.mouse_pressed = (False, False, False)
+        self.clock_class = pygame.time.Clock
+
+    ##################################################
+    # Frame timing
+    ##################################################
+
+    def frame_end(self) -> None:
+        if self.frame_start is not None:
+            self.frame_times.setdefault(self.frame_state, list()).append(time.perf_counter() - self.frame_start)
+        self.frame += 1
+        if self.frame > self.frames:
+            raise Match3BenchStop
+
+    def frame_begin(self) -> None:
+        # Feed the events before starting the frame timer, the time spent generating them isn't part of the frame
+        if self.events is None:
+            self.script()
+        else:
+            self.playback()
+        self.frame_state = self.gui.game_state.name
+        self.frame_start = time.perf_counter()
+
+    def timed_tween_update(self, update):
+        def wrapper(tween: Tween, now: int) -> bool:
+            time_start = time.perf_counter()
+            try:
+                return update(tween, now)
+            finally:
+                self.tween_times.setdefault(tween.name, list()).append(time.perf_counter() - time_start)
+
+        return wrapper
+
+    ##################################################
+    # Input
+    ##################################################
+
+    def get_mouse_pos(self) -> tuple[int, int]:
+        return self.mouse_pos
+
+    def get_mouse_pressed(self, num_buttons: int = 3) -> tuple[bool, ...]:
+        return self.mouse_pressed[:num_buttons]
+
+    def post(self, event: dict) -> None:
+        # The widgets poll the mouse state instead of reading the events, keep a virtual mouse in sync with them
+        if "pos" in event:
+            self.mouse_pos = tuple(event["pos"])
+        if event["type"] == "MOUSEBUTTONDOWN" and event["button"] == 1:
+            self.mouse_pressed = (True, False, False)
+        elif event["type"] == "MOUSEBUTTONUP" and event["button"] == 1:
+            self.mouse_pressed = (False, False, False)
+        attributes = {key: tuple(value) if type(value) == list else value for key, value in event.items() if key not in ("type", "frame")}
+        if event["type"] == "MOUSEMOTION":
+            attributes["rel"] = (0, 0)
+            attributes["buttons"] = tuple(int(pressed) for pressed in self.mouse_pressed)
+        pygame.event.post(pygame.event.Event(getattr(pygame, event["type"]), **attributes))
+        self.recorded.append(dict(event, frame=self.frame))
+
+    def playback(self) -> None:
+        while len(self.events) > 0 and self.events[0]["frame"] <= self.frame:
+            self.post(self.events.pop(0))
+        if len(self.events) == 0 and self.gui.game_state != GameState.RUNNING:
+            raise Match3BenchStop
+
+    def click(self, x: float, y: float) -> None:
+        # Press in this frame, release in the next one
+        self.post({"type": "MOUSEBUTTONDOWN", "pos": [int(x), int(y)], "button": 1})
+        self.next_action = self.frame + 1
+        self.release = {"type": "MOUSEBUTTONUP", "pos": [int(x), int(y)], "button": 1}
+
+    def click_widget(self, name: str, offset: int = 0) -> None:
+        widget = self.gui.active_widgets[name]
+        self.click(widget.getX() + widget.getWidth() / 2, widget.getY() + widget.getHeight() * (offset + 0.5))
+
+    def drag(self, board_point1: tuple[int, int], board_point2: tuple[int, int]) -> None:
+        (x1, y1) = self.gui.board_pos_to_win_pos(*board_point1, True)
+        (x2, y2) = self.gui.board_pos_to_win_pos(*board_point2, True)
+        self.post({"type": "MOUSEBUTTONDOWN", "pos": [int(x1), int(y1)], "button": 1})
+        self.post({"type": "MOUSEMOTION", "pos": [int(x2), int(y2)]})
+        self.next_action = self.frame + 1
+        self.release = {"type": "MOUSEBUTTONUP", "pos": [int(x2), int(y2)], "button": 1}
+
+    def script(self) -> None:
+        # Play a game through the menus, the same way a user would
+        if self.frame < self.next_action:
+            return
+        if self.release is not None:
+            self.post(self.release)
+            self.release = None
+            self.next_action = self.frame + 2
+            return
+        gui = self.gui
+        if gui.game_state == GameState.MAINMENU:
+            self.click_widget("new_game")
+        elif gui.game_state == GameState.CHOOSESIZE:
+            dropdown = gui.active_widgets["choose_board_size"]
+            if dropdown.getSelected() != self.size:
+                if not dropdown.dropped:
+                    self.click_widget("choose_board_size")
+                else:
+                    self.click_widget("choose_board_size", gui.board_sizes.index(self.size) + 1)
+            else:
+                self.click_widget("start")
+        elif gui.game_state == GameState.RUNNING:
+            if gui.board_locked() or gui.play is None or len(gui.play) == 0:
+                return
+            self.num_moves += 1
+            if self.num_moves % self.hint_interval == 0:
+                self.click_widget("hint")
+                return
+            (swap_points, _) = gui.board.find_a_play()
+            self.drag(*swap_points)
+            self.next_action = self.frame + self.move_interval
+        else:
+            # Don't go through the high score screens, they write to the high scores file
+            raise Match3BenchStop
+
+    ##################################################
+    # Run
+    ##################################################
+
+    def run(self) -> dict:
+        random.seed(self.seed)
+        update = Tween.update
+        patched = {
+            (pygame.time, "Clock"): lambda: Match3BenchClock(self),
+            (pygame.mouse, "get_pos"): self.get_mouse_pos,
+            (pygame.mouse, "get_pressed"): self.get_mouse_pressed,
+            (Tween, "update"): self.timed_tween_update(update),
+        }
+        originals = {key: getattr(*key) for key in patched}
+        for (owner, name), value in patched.items():
+            setattr(owner, name, value)
+        time_start = time.perf_counter()
+        try:
+            self.gui.run()
+        except Match3BenchStop:
+            pass
+        finally:
+            for (owner, name), value in originals.items():
+                setattr(owner, name, value)
+            resolution = pygame.display.get_surface().get_size()
+            self.gui.shutdown()
+        elapsed = time.perf_counter() - time_start
+        return {
+            "frames": self.frame - 1,
+            "elapsed": elapsed,
+            "resolution": resolution,
+            "states": {state: self.stats(times) for state, times in self.frame_times.items()},
+            "tweens": {name: self.stats(times) for name, times in self.tween_times.items()},
+        }
+
+    @staticmethod
+    def stats(times: list[float]) -> dict:
+        times = sorted(times)
+        return {
+            "count": len(times),
+            "mean": statistics.fmean(times) * 1000,
+            "p50": times[int(len(times) * 0.5)] * 1000,
+            "p95": times[int(len(times) * 0.95)] * 1000,
+            "max": times[-1] * 1000,
+        }
+
+    @staticmethod
+    def report(result: dict) -> str:
+        lines = [f"{result['frames']} frames at {result['resolution'][0]}x{result['resolution'][1]} in {result['elapsed']:.2f}s"]
+        for title, key in (("Game state", "states"), ("Tween", "tweens")):
+            lines.append(f"{title:<18}{'Count':>8}{'Mean (ms)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}{'Max (ms)':>12}")
+            for name, stats in result[key].items():
+                lines.append(f"{name:<18}{stats['count']:>8}{stats['mean']:>12.3f}{stats['p50']:>12.3f}{stats['p95']:>12.3f}{stats['max']:>12.3f}")
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless frame time benchmark of Match3GUI.")
+    parser.add_argument("--frames", type=int, default=3000, help="maximum number of frames to run")
+    parser.add_argument("--size", type=int, default=7, choices=Match3GUI.board_sizes, help="board size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--game-time", type=int, default=20, help="game duration in seconds")
+    parser.add_argument("--render-size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="draw the game at this resolution instead of the display resolution")
+    parser.add_argument("--play", help="play back the events recorded in this file instead of the scripted game")
+    parser.add_argument("--record", help="record the events fed to the game in this file")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    events = None
+    if args.play is not None:
+        with open(args.play, 'r') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+
+    bench = Match3Bench(args.frames, args.size, args.seed, args.game_time, events, args.render_size)
+    result = bench.run()
+    print(Match3Bench.report(result))
+
+    if args.record is not None:
+        with open(args.record, 'w') as f:
+            for event in bench.recorded:
+                f.write(json.dumps(event) + "\n")
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=4)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
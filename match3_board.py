@@ -5,7 +5,7 @@ import random
 class Match3Board:
     empty = ord(' ') - ord('a')
 
-    def __init__(self, cols: int = 5, rows: int = 5, num_values: int = 4) -> None:
+    def __init__(self, cols: int = 5, rows: int = 5, num_values: int = 4, seed: int = None) -> None:
         if cols < 3 or rows < 3:
             raise ValueError("Minimum size is 3x3.")
         if cols > 27 or rows > 27:
@@ -17,6 +17,11 @@ class Match3Board:
         self.cols = cols
         self.rows = rows
         self.values = tuple([i for i in range(num_values)])
+        # Each board has its own generator so its state can be saved with the board, it's seeded from the global one
+        # by default so seeding the random module still makes the boards reproducible
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.random = random.Random(seed)
         self.board = None
         self.clear()
         try:
@@ -37,6 +42,12 @@ class Match3Board:
                 result += "\n"
         return result
 
+    def copy(self) -> "Match3Board":
+        board = copy.copy(self)
+        board.board = [row[:] for row in self.board]
+        board.random = copy.copy(self.random)
+        return board
+
     def clear(self, points: list[tuple[int, int]] = None) -> None:
         if points is None:
             self.board = [[self.empty for _ in range(self.cols)] for _ in range(self.rows)]
@@ -57,7 +68,7 @@ class Match3Board:
                 if self.board[row][col] == self.empty:
                     values_left = list(self.values)
                     while len(values_left):
-                        value = random.choice(values_left)
+                        value = self.random.choice(values_left)
                         values_left.remove(value)
                         self.board[row][col] = value
                         # Check that placing the new random value doesn't result in a match3 group.
@@ -142,6 +153,49 @@ class Match3Board:
                         return (swap_points, groups)
         return tuple()
 
+    def count_plays(self) -> int:
+        # Number of distinct swaps that make a match3 group, each pair of neighbors is tried once
+        num_plays = 0
+        for row in range(self.rows):
+            for col in range(self.cols):
+                for (neigh_x, neigh_y) in ((col + 1, row), (col, row + 1)):
+                    if self.out_of_bounds(neigh_x, neigh_y) or self.board[row][col] == self.board[neigh_y][neigh_x]:
+                        continue
+                    if self.is_swap_valid((col, row), (neigh_x, neigh_y)):
+                        num_plays += 1
+        return num_plays
+
+    def reshuffle(self, attempts: int = 100) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+        # Rearrange the tiles already on the board so that there is at least one play and no match3 group.
+        # The cells are filled row by row with the first tile left in a shuffled pool that doesn't line up with the
+        # two tiles placed before it, to the left or above. Returns the (src, dst) points of the tiles that moved,
+        # an empty list (and the board unchanged) if no arrangement was found.
+        num_cells = self.cols * self.rows
+        backup_board = [row[:] for row in self.board]
+        for _ in range(attempts):
+            # The tiles are handled as cell indices, the points are only built for the arrangement found
+            pool = list(range(num_cells))
+            self.random.shuffle(pool)
+            sources = list()
+            for cell in range(num_cells):
+                (row, col) = divmod(cell, self.cols)
+                for i, src in enumerate(pool):
+                    value = backup_board[src // self.cols][src % self.cols]
+                    if col >= 2 and self.board[row][col - 1] == value and self.board[row][col - 2] == value:
+                        continue
+                    if row >= 2 and self.board[row - 1][col] == value and self.board[row - 2][col] == value:
+                        continue
+                    self.board[row][col] = value
+                    sources.append(pool.pop(i))
+                    break
+                else:
+                    break
+            if len(pool) == 0 and len(self.find_a_play()) > 0:
+                return [((src % self.cols, src // self.cols), (cell % self.cols, cell // self.cols))
+                        for cell, src in enumerate(sources) if src != cell]
+        self.board = backup_board
+        return list()
+
     def shift_down(self) -> list[tuple[int, int]]:
         floating = list()
         for row in reversed(range(0, self.rows - 1)):
@@ -151,6 +205,26 @@ class Match3Board:
                     self.swap((col, row), (col, row + 1))
         return floating
 
+    def collapse(self) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+        # Shift down all the floating tiles to the bottom of their column and fill the empty spaces left at the top
+        # with new tiles, in one go. Returns the (src, dst) points of all the tiles that moved, the new tiles start
+        # stacked above the board (negative rows) so that they fall the same distance as the tiles below them.
+        moves = list()
+        num_new = list()
+        for col in range(self.cols):
+            dst_row = self.rows - 1
+            for row in reversed(range(self.rows)):
+                if self.board[row][col] == self.empty:
+                    continue
+                if row != dst_row:
+                    self.swap((col, row), (col, dst_row))
+                    moves.append(((col, row), (col, dst_row)))
+                dst_row -= 1
+            num_new.append(dst_row + 1)
+        for (col, row) in self.populate(rows=(0, max(num_new)), no_valid_play_check=False, no_match3_group_check=False):
+            moves.append(((col, row - num_new[col]), (col, row)))
+        return moves
+
     def get_valid_groups(self) -> list[list[tuple[int, int]]]:
         groups = list()
         for row in range(self.rows):
@@ -0,0 +1,85 @@
+import time
+import pygame
+import pygame_widgets as pygamew
+
+
+class Match3EventDispatcher:
+    cell_size = 64
+    mouse_events = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+    def __init__(self) -> None:
+        # Uniform grid of cells with the names of the widgets overlapping each one
+        self.cells = dict()
+        self.rects = dict()
+        self.hovered = set()
+        self.states = dict()
+        self.stale = True
+
+    def rebuild(self, widgets: dict) -> None:
+        self.cells = dict()
+        self.rects = dict()
+        for name, widget in widgets.items():
+            rect = self.widget_rect(widget)
+            self.rects[name] = rect
+            for cell_x in range(rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1):
+                for cell_y in range(rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1):
+                    self.cells.setdefault((cell_x, cell_y), list()).append(name)
+        self.stale = False
+
+    def hit(self, pos: tuple[int, int]) -> set[str]:
+        cell = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        return {name for name in self.cells.get(cell, ()) if self.rects[name].collidepoint(pos)}
+
+    def route(self, events: list, widgets: dict, mouse_pos: tuple[int, int]) -> set[str]:
+        # Return the widgets that must listen to the events of this frame: the ones under the cursor and the ones
+        # it has just left (so they go back to their inactive state), none if the mouse didn't do anything
+        moved = any([event.type in self.mouse_events for event in events])
+        if self.stale or set(self.rects) != set(widgets):
+            self.rebuild(widgets)
+            moved = True
+        if not moved:
+            return set()
+        hovered = self.hit(mouse_pos)
+        targets = (hovered | self.hovered) & set(widgets)
+        self.hovered = hovered
+        return targets
+
+    def changed(self, widgets: dict, names) -> bool:
+        return any([self.visual_state(widgets[name]) != self.states.get(name) for name in names if name in widgets])
+
+    def snapshot(self, widgets: dict, names = None) -> None:
+        # Keep the visual state of the widgets as they were last drawn
+        if names is None:
+            names = widgets.keys()
+        for name in names:
+            if name in widgets:
+                self.states[name] = self.visual_state(widgets[name])
+
+    @staticmethod
+    def widget_rect(widget) -> pygame.Rect:
+        rect = pygame.Rect(widget.getX(), widget.getY(), widget.getWidth(), widget.getHeight())
+        if type(widget) == pygamew.Dropdown:
+            # The choices are placed below the head
+            rect.height *= len(widget._Dropdown__choices) + 1
+        elif type(widget) == pygamew.Toggle:
+            # The rounded ends are drawn outside of the widget rect
+            rect.inflate_ip(widget.handleRadius * 2, 0)
+        elif type(widget) == pygamew.Button:
+            rect.width += widget.shadowDistance
+            rect.height += widget.shadowDistance
+        return rect
+
+    @staticmethod
+    def visual_state(widget) -> tuple:
+        if type(widget) == pygamew.Button:
+            return (widget.colour, widget.borderColour, widget._hidden)
+        if type(widget) == pygamew.Dropdown:
+            parts = [widget._Dropdown__main] + widget._Dropdown__choices
+            return (widget.dropped, widget.getSelected()) + tuple([part.colour for part in parts])
+        if type(widget) == pygamew.TextBox:
+            # The cursor blinks when the text box is drawn
+            blink = widget.selected and time.time() - widget.cursorTime >= widget.CURSOR_INTERVAL / 1000
+            return (tuple(widget.text), widget.cursorPosition, widget.selected, widget.showCursor, blink)
+        if type(widget) == pygamew.Toggle:
+            return (widget.value,)
+        return ()
@@ -0,0 +1,139 @@
+import time
+from match3_board import Match3Board
+
+
+class Match3Game:
+    board_sizes = list(range(5, 14))
+    time_init = 60000
+
+    def __init__(self, size: int = 7, time_init: int = None, seed: int = None, board: Match3Board = None) -> None:
+        if size not in self.board_sizes:
+            raise ValueError(f"Board size must be between {self.board_sizes[0]} and {self.board_sizes[-1]}.")
+        self.size = size
+        # A board already generated (e.g. with another number of values) can be played instead of a new one
+        if board is None:
+            board = Match3Board(size, size, self.num_values_for_size(size), seed)
+        elif board.cols != size or board.rows != size:
+            raise ValueError(f"Board must be {size}x{size}.")
+        self.board = board
+        if time_init is not None:
+            self.time_init = time_init
+        self.time_start = self.now()
+        self.score = 0
+        self.time_score = 0
+        self.hint_cut_score = False
+        self.num_moves = 0
+        self.num_hints = 0
+        self.num_regenerations = 0
+
+    ##################################################
+    # Rules
+    ##################################################
+
+    @staticmethod
+    def num_values_for_size(size: int) -> int:
+        num_values = size - 1
+        if size > 7:
+            num_values -= 1
+        if size > 10:
+            num_values -= 1
+        return num_values
+
+    @staticmethod
+    def calc_move_score(board: Match3Board, groups: list[list[tuple[int, int]]], cascade_bonus_score: int,
+                        hint_cut_score: bool) -> tuple[int, int]:
+        # Score and extra time (ms) of one step of a cascade
+        score = board.calc_score(groups) + cascade_bonus_score
+        group_bonus_score = 0
+        group_bonus = 0
+        for _ in range(len(groups) - 1):
+            group_bonus += 1
+            group_bonus_score += group_bonus
+        time_score = ((score + cascade_bonus_score + group_bonus_score) * 100)
+        if hint_cut_score:
+            score //= 2
+            time_score = score * 100
+        return (score, time_score)
+
+    @staticmethod
+    def calc_time_left(time_init: int, time_score: int, time_elapsed: int) -> int:
+        return time_init + time_score - time_elapsed
+
+    @staticmethod
+    def are_neighbors(point1: tuple[int, int], point2: tuple[int, int]) -> bool:
+        return abs(point1[0] - point2[0]) + abs(point1[1] - point2[1]) == 1
+
+    ##################################################
+    # Game
+    ##################################################
+
+    @staticmethod
+    def now() -> int:
+        return int(time.monotonic() * 1000)
+
+    def get_time_left(self) -> int:
+        return self.calc_time_left(self.time_init, self.time_score, self.now() - self.time_start)
+
+    def is_over(self) -> bool:
+        return self.get_time_left() <= 0
+
+    def swap(self, point1: tuple[int, int], point2: tuple[int, int]) -> dict:
+        # Play a move and resolve its whole cascade at once, the same steps Match3GUI.running() animates
+        result = {"valid": False, "score": 0, "time_score": 0, "depth": 0, "regenerated": False, "plays": 0}
+        self.num_moves += 1
+        if not self.are_neighbors(point1, point2) or not self.board.is_swap_valid(point1, point2):
+            return result
+        result["valid"] = True
+        self.board.swap(point1, point2)
+        cascade_bonus = 0
+        cascade_bonus_score = 0
+        groups = self.board.get_valid_groups()
+        while len(groups) > 0:
+            (score, time_score) = self.calc_move_score(self.board, groups, cascade_bonus_score, self.hint_cut_score)
+            self.hint_cut_score = False
+            self.score += score
+            self.time_score += time_score
+            result["score"] += score
+            result["time_score"] += time_score
+            result["depth"] += 1
+            self.board.clear([point for group in groups for point in group])
+            self.board.collapse()
+            cascade_bonus += 1
+            cascade_bonus_score += cascade_bonus
+            groups = self.board.get_valid_groups()
+        # Reshuffle the board if there is no valid play left
+        result["plays"] = self.board.count_plays()
+        if result["plays"] == 0:
+            self.regenerate()
+            result["regenerated"] = True
+            result["plays"] = self.board.count_plays()
+        return result
+
+    def regenerate(self) -> None:
+        # The tiles are reshuffled in place, a new board is only generated if no arrangement with a play was found
+        if len(self.board.reshuffle()) == 0:
+            self.board.clear()
+            try:
+                self.board.populate()
+            except RecursionError:
+                raise RuntimeError("Couldn't regenerate the board.")
+        self.num_regenerations += 1
+
+    def hint(self) -> tuple[tuple[int, int], tuple[int, int]]:
+        # Showing a hint halves the score of the next move
+        (swap_points, _) = self.board.find_a_play()
+        self.hint_cut_score = True
+        self.num_hints += 1
+        return swap_points
+
+    def get_state(self) -> dict:
+        return {
+            "size": self.size,
+            "board": self.board.board,
+            "score": self.score,
+            "time_left": max(self.get_time_left(), 0),
+            "over": self.is_over(),
+            "moves": self.num_moves,
+            "hints": self.num_hints,
+            "regenerations": self.num_regenerations,
+        }
@@ -1,13 +1,27 @@
+import contextlib
+import bisect
 import json
-import jsonschema
 import math
 import os
 import pygame
 import pygame_widgets as pygamew
+import queue
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from sys import exit
 from pygame import gfxdraw
 from enum import Enum, auto
+from match3_animation import Timeline, Tween
+from match3_audio import Match3Audio
 from match3_board import Match3Board
+from match3_dispatch import Match3EventDispatcher
+from match3_game import Match3Game
+from match3_profile import Match3FrameProfiler
+from match3_replay import Match3MoveLog, Match3Replay, Match3ReplayError
+from match3_scores import Match3ScoreStore
+from match3_telemetry import Match3Telemetry
 
 
 class GameState(Enum):
@@ -62,38 +76,33 @@ class Match3GUI:
     swap_ani_time = 200
     shift_down_ani_time = 200
     clear_ani_time = 200
+    shuffle_ani_time = 400
     plus_score_blink_ani_time = 100
     ani_fps = 60
+    tile_sprite_cache_size = 256
+    label_cache_size = 256
     main_loop_refresh_rate = 30
+    resize_debounce_time = 150
+    # When nothing is being animated, sleep until the next event or scheduled change instead of polling every frame
+    idle_mode = True
+    idle_max_timeout = 1000
+    worker_event = pygame.USEREVENT
+    frame_overlay_key = pygame.K_F3
+    frame_overlay_refresh_time = 500
+    telemetry_frames_interval = 10000
     flags = pygame.RESIZABLE | pygame.HWSURFACE | pygame.NOFRAME
+    render_flags = pygame.SCALED | pygame.FULLSCREEN | pygame.NOFRAME
+    render_min_size = (640, 480)
     min_font_size = 20
     min_char_width = 13.8
     min_char_height = 13.8
     min_char_sep_height = min_char_height / 2
-    time_init = 60000
-    board_sizes = list(range(5, 14))
+    time_init = Match3Game.time_init
+    board_sizes = Match3Game.board_sizes
     high_score_name_max_len = 20
     high_scores_filename = "high_scores.json"
-    high_scores_schema = '''
-    {
-        "type": "object",
-        "additionalProperties": {
-            "type": "array",
-            "items": {
-                "type": "array",
-                "items": [
-                    {"type": "string", "maxLength": 20},
-                    {"type": "integer", "minimum": 1}
-                ],
-                "additionalProperties": false
-            },
-            "maxItems": 5
-        },
-        "propertyNames": {"enum": []}
-    }
-    '''
-    high_scores_schema = json.loads(high_scores_schema)
-    high_scores_schema["propertyNames"]["enum"] = [f"{n}x{n}" for n in board_sizes]
+    high_scores_db_filename = "high_scores.db"
+    replays_dir = "replays"
     preferences_filename = "preferences.json"
     preferences_schema = '''
     {
@@ -116,7 +125,13 @@ class Match3GUI:
     music_dir = f"{audio_dir}/music"
     background_music_filename = f"{music_dir}/background_music.ogg"
 
-    def __init__(self) -> None:
+    def __init__(self, profiler = None, frame_times_filename: str = None, render_size: tuple[int, int] = None,
+                 telemetry_filename: str = None, replay_filename: str = None, audio_buffer_size: int = None) -> None:
+        self.profiler = profiler
+        self.frame_profiler = Match3FrameProfiler(filename=frame_times_filename)
+        self.frame_overlay = False
+        self.frame_overlay_surf = None
+        self.frame_overlay_time = 0
         self.board = None
         self.screen_surf = None
         self.game_surf = None
@@ -124,6 +139,13 @@ class Match3GUI:
         self.sidebar_surf = None
         self.clock = None
         self.circle_radius = 0
+        self.col_w = 0
+        self.row_h = 0
+        self.board_offset = (0, 0)
+        self.cell_bounds_x = []
+        self.cell_bounds_y = []
+        self.tile_centers = []
+        self.cell_rects = []
         self.mouse_state = MouseState.WAITING
         self.board_pos_src = None
         self.score = 0
@@ -132,18 +154,24 @@ class Match3GUI:
         self.time_score = 0
         self.time_left_sec = int(self.time_left / 1000)
         self.active_widgets = {}
+        self.widget_dispatcher = Match3EventDispatcher()
         self.hint = False
         self.hint_cut_score = False
-        self.plus_score_ani_time_start = 0
-        self.curr_plus_score_ani_time = self.plus_score_ani_time + 1
+        self.plus_score_visible = False
+        self.plus_score_tween = None
         self.curr_score = 0
         self.curr_time_score = 0
+        self.cascading = False
+        self.cascade_bonus = 0
+        self.cascade_bonus_score = 0
         self.game_state = GameState.MAINMENU
         self.font_size = self.min_font_size
         self.char_width = self.min_char_width
         self.char_height = self.min_char_height
         self.char_sep_height = self.min_char_sep_height
         self.font = None
+        self.fonts = {}
+        self.labels = OrderedDict()
         self.pause = False
         self.pause_time = 0
         self.time_paused = 0
@@ -151,241 +179,241 @@ class Match3GUI:
         self.prev_state = None
         self.high_scores_state = 5
         self.high_scores = {}
+        self.score_store = None
+        self.render_size = None
+        if render_size is not None:
+            self.render_size = (max(render_size[0], self.render_min_size[0]), max(render_size[1], self.render_min_size[1]))
         self.preferences = {}
-        self.sounds = {}
+        self.audio = Match3Audio(self.sounds_dir, audio_buffer_size)
         self.last_beep_sound_time = 0
+        self.dirty_rects = []
+        self.tile_sprites = OrderedDict()
+        self.board_layer = None
+        self.board_layer_tweens = []
+        self.board_layer_points = set()
+        self.timeline = Timeline()
+        self.resize_pending = False
+        self.resize_time = 0
+        self.resize_events = []
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        # The sound effects are decoded in their own thread, the board jobs of the worker don't wait for them
+        self.audio_loader = ThreadPoolExecutor(max_workers=1)
+        self.music_loaded = False
+        self.worker_jobs = {}
+        self.worker_results = queue.Queue()
+        self.board_generation = 0
+        self.play = None
+        self.num_plays = None
+        self.regenerating = False
+        self.regenerated_board = None
+        self.telemetry = Match3Telemetry(telemetry_filename)
+        self.move_log = None
+        self.replay_filename = replay_filename
+        self.replay = None
+        self.replay_time_init = self.time_init
+        self.replay_index = 0
+        self.telemetry_frames_time = 0
+        self.move_start = None
+        self.move_latency = None
+        self.move_valid = False
+        self.move_depth = 0
+        self.move_score = 0
+        self.num_moves = 0
+        self.num_hints = 0
+        self.num_regenerations = 0
 
     ##################################################
     # Animate functions
     ##################################################
 
-    def animate_swap(self, board_point1: tuple[int, int], board_point2: tuple[int, int]) -> None:
+    def animate_swap(self, board_point1: tuple[int, int], board_point2: tuple[int, int], on_finish=None) -> None:
         self.play_sound("swap")
 
         board_points = (board_point1, board_point2)
-        win_points = (list(self.board_pos_to_win_pos(*board_points[0])), list(self.board_pos_to_win_pos(*board_points[1])))
-
-        target_dist = (
-            [win_points[1][0] - win_points[0][0], win_points[1][1] - win_points[0][1]],  # [dst_p1_x - src_p1_x, dst_p1_y - src_p1_y]
-            [win_points[0][0] - win_points[1][0], win_points[0][1] - win_points[1][1]],  # [dst_p2_x - src_p2_x, dst_p2_y - src_p2_y]
-        )
-        curr_pos = [list(win_points[0]), list(win_points[1])]
-
-        curr_ani_time = 0
-        ani_time_start = pygame.time.get_ticks()
-
-        while curr_pos[0] != win_points[1] or curr_pos[1] != win_points[0]:  # curr_p1 != dst_p1 or curr_p2 != dst_p2
-            if self.process_events():
-                self.screen_surf.fill(self.background_color["screen"])
-                self.game_surf.fill(self.background_color["game"])
-                self.draw_sidebar()
-                win_points = (list(self.board_pos_to_win_pos(*board_points[0])), list(self.board_pos_to_win_pos(*board_points[1])))
-                target_dist = (
-                    [win_points[1][0] - win_points[0][0], win_points[1][1] - win_points[0][1]],  # [dst_p1_x - src_p1_x, dst_p1_y - src_p1_y]
-                    [win_points[0][0] - win_points[1][0], win_points[0][1] - win_points[1][1]],  # [dst_p2_x - src_p2_x, dst_p2_y - src_p2_y]
-                )
-
-            self.draw_board(no_draw_pts=board_points)
-
-            curr_ani_time = pygame.time.get_ticks() - ani_time_start
+        color_indices = [self.board.board[y][x] for (x, y) in board_points]
 
+        def update(progress: float) -> None:
+            win_points = [self.board_pos_to_win_pos(*p) for p in board_points]
             for p_i in reversed(range(2)):
                 # Calculate the new position
                 src_pos = win_points[p_i]
                 dst_pos = win_points[int(not p_i)]
-                curr_dist = (target_dist[p_i][0] * curr_ani_time / self.swap_ani_time, target_dist[p_i][1] * curr_ani_time / self.swap_ani_time)
-                curr_pos[p_i] = [src_pos[0] + curr_dist[0], src_pos[1] + curr_dist[1]]
-                curr_pos[p_i] = [int(curr_pos[p_i][0]), int(curr_pos[p_i][1])]
-                for i in range(2):
-                    dir = dst_pos[i] - src_pos[i]
-                    if (dir < 0 and curr_pos[p_i][i] < dst_pos[i]) or (dir > 0 and curr_pos[p_i][i] > dst_pos[i]):
-                        curr_pos[p_i][i] = dst_pos[i]
+                curr_pos = [int(src_pos[i] + (dst_pos[i] - src_pos[i]) * progress) for i in range(2)]
                 # Draw the moving circles
-                color_index = self.board.board[board_points[p_i][1]][board_points[p_i][0]]
-                if color_index < 0:
+                if color_indices[p_i] < 0:
                     continue
-                self.draw_circle(curr_pos[p_i][0], curr_pos[p_i][1], self.colors[color_index])
+                self.draw_circle(curr_pos[0], curr_pos[1], self.colors[color_indices[p_i]])
 
-            pygame.display.flip()
+        self.timeline.add(Tween("swap", self.swap_ani_time, update, on_finish, board_points))
 
-    def animate_clear(self, board_points: list[tuple[int, int]], no_more_moves: bool = False) -> None:
+    def animate_clear(self, board_points: list[tuple[int, int]], on_finish=None) -> None:
         self.play_sound("match")
 
-        win_points = [self.board_pos_to_win_pos(*p) for p in board_points]
-
-        target_transparency = 0
-        target_size = 0
-        curr_transparency = 255
-        curr_size = self.circle_radius
-
-        curr_ani_time = 0
-        ani_time_start = pygame.time.get_ticks()
-
-        clear_ani_time = self.clear_ani_time
-        if no_more_moves:
-            clear_ani_time *= 5
-
-        while curr_transparency != target_transparency or curr_size != target_size:
-            if self.process_events():
-                self.screen_surf.fill(self.background_color["screen"])
-                self.game_surf.fill(self.background_color["game"])
-                self.draw_sidebar()
-                win_points = [self.board_pos_to_win_pos(*p) for p in board_points]
-
-            self.draw_board(no_draw_pts=board_points)
-
-            curr_ani_time = pygame.time.get_ticks() - ani_time_start
+        color_indices = [self.board.board[y][x] for (x, y) in board_points]
 
-            # Calculate the new size and the new transparency
-            curr_transparency = int(target_transparency * (1 - curr_ani_time / clear_ani_time))
-            if curr_transparency > target_transparency:
-                curr_transparency = target_transparency
-            curr_size = int(self.circle_radius * (1 - curr_ani_time / clear_ani_time))
-            if curr_size < target_size:
-                curr_size = target_size
+        def update(progress: float) -> None:
+            # Calculate the new size
+            curr_size = int(self.circle_radius * (1 - progress))
 
-            # Draw the moving circles
+            # Draw the shrinking circles
             for i, p in enumerate(board_points):
-                color_index = self.board.board[p[1]][p[0]]
-                if color_index < 0:
+                if color_indices[i] < 0:
                     continue
-                self.draw_circle(win_points[i][0], win_points[i][1], self.colors[color_index], curr_size)
-
-            if no_more_moves:
-                texts = ("NO MORE MOVES", "REGENERATING BOARD")
-                width = (max([len(text) for text in texts]) + 4) * self.char_width
-                height = (math.ceil(self.char_height) + math.ceil(self.char_sep_height)) * 2
-                x = (self.board_surf.get_width() - width) / 2 + self.board_surf.get_abs_offset()[0]
-                y = (self.board_surf.get_height() - height * 2) / 2 + self.board_surf.get_abs_offset()[1]
-                for text in texts:
-                    button = pygamew.Button(
-                        self.screen_surf, x, y, width, height,
-                        text=text,
-                        textColour=(32, 255, 32),
-                        font=self.font,
-                        colour=self.background_color["game"],
-                        hoverColour=self.background_color["game"],
-                        pressedColour=self.background_color["game"]
-                    )
-                    button.draw()
-                    y += height
-
-            pygame.display.flip()
-
-    def animate_shift_down(self, shifted_bp: list[tuple[int, int]], num_vertical_points: int) -> None:
-        board_points_dst = shifted_bp
-        board_points_src = [(x, y - 1) for (x, y) in board_points_dst]
-        win_points_dst = [list(self.board_pos_to_win_pos(*p)) for p in board_points_dst]
-        win_points_src = [list(self.board_pos_to_win_pos(*p)) for p in board_points_src]
-        color_indices = [self.board.board[y][x] for (x, y) in board_points_dst]
+                win_point = self.board_pos_to_win_pos(*p)
+                self.draw_circle(win_point[0], win_point[1], self.colors[color_indices[i]], curr_size)
 
-        curr_pos = [[x, y] for (x, y) in win_points_src]
+        self.timeline.add(Tween("clear", self.clear_ani_time, update, on_finish, board_points))
 
-        ani_time = self.shift_down_ani_time / min((num_vertical_points, 2))
-        curr_ani_time = 0
-        ani_time_start = pygame.time.get_ticks()
-
-        while any([curr_pos[i] != win_points_dst[i] for i in range(len(curr_pos))]):
-            if self.process_events():
-                self.screen_surf.fill(self.background_color["screen"])
-                self.game_surf.fill(self.background_color["game"])
-                self.draw_sidebar()
-                win_points_dst = [list(self.board_pos_to_win_pos(*p)) for p in board_points_dst]
-                win_points_src = [list(self.board_pos_to_win_pos(*p)) for p in board_points_src]
-
-            self.draw_board(no_draw_pts=board_points_src + board_points_dst)
+    def animate_fall(self, moves: list[tuple[tuple[int, int], tuple[int, int]]], num_vertical_points: int, on_finish=None) -> None:
+        board_points_src = [src for (src, _) in moves]
+        board_points_dst = [dst for (_, dst) in moves]
+        color_indices = [self.board.board[y][x] for (x, y) in board_points_dst]
 
-            curr_ani_time = pygame.time.get_ticks() - ani_time_start
+        # All the tiles fall at the same speed, the time of each one is proportional to the distance it falls
+        row_ani_time = self.shift_down_ani_time / min((num_vertical_points, 2))
+        distances = [dst[1] - src[1] for (src, dst) in moves]
+        ani_time = row_ani_time * max(distances)
 
-            for p_i in range(len(curr_pos)):
+        def update(progress: float) -> None:
+            curr_ani_time = ani_time * progress
+            for p_i in range(len(moves)):
                 # Calculate the new position
-                src_pos = win_points_src[p_i]
-                dst_pos = win_points_dst[p_i]
-                target_dist = ((dst_pos[0] - src_pos[0]), (dst_pos[1] - src_pos[1]))
-                curr_dist = (target_dist[0] * curr_ani_time / ani_time, target_dist[1] * curr_ani_time / ani_time)
-                curr_pos[p_i] = [src_pos[0] + curr_dist[0], src_pos[1] + curr_dist[1]]
-                curr_pos[p_i] = [int(curr_pos[p_i][0]), int(curr_pos[p_i][1])]
-                for i in range(2):
-                    dir = dst_pos[i] - src_pos[i]
-                    if (dir < 0 and curr_pos[p_i][i] < dst_pos[i]) or (dir > 0 and curr_pos[p_i][i] > dst_pos[i]):
-                        curr_pos[p_i][i] = dst_pos[i]
+                src_pos = self.board_pos_to_win_pos(*board_points_src[p_i])
+                dst_pos = self.board_pos_to_win_pos(*board_points_dst[p_i])
+                tile_progress = min(curr_ani_time / (row_ani_time * distances[p_i]), 1)
+                curr_pos = [int(src_pos[i] + (dst_pos[i] - src_pos[i]) * tile_progress) for i in range(2)]
                 # Draw the moving circles
-                color_index = color_indices[p_i]
-                if color_index < 0:
+                if color_indices[p_i] < 0:
                     continue
-                self.draw_circle(curr_pos[p_i][0], curr_pos[p_i][1], self.colors[color_index])
+                self.draw_circle(curr_pos[0], curr_pos[1], self.colors[color_indices[p_i]])
 
-            pygame.display.flip()
+        self.timeline.add(Tween("fall", ani_time, update, on_finish, board_points_src + board_points_dst))
 
-    def animate_hint(self, board_point1: tuple[int, int], board_point2: tuple[int, int]) -> None:
-        self.play_sound("hint")
+    def animate_shuffle(self, moves: list[tuple[tuple[int, int], tuple[int, int]]], on_finish=None) -> None:
+        self.play_sound("swap")
 
-        board_points = (board_point1, board_point2)
-        win_points = (list(self.board_pos_to_win_pos(*board_points[0])), list(self.board_pos_to_win_pos(*board_points[1])))
+        # The tiles slide diagonally across the cells of the ones that stay, so the whole board is animated and the
+        # tiles that stay are drawn as not moving
+        sources = {dst: src for (src, dst) in moves}
+        board_points_dst = [(x, y) for y in range(self.board.rows) for x in range(self.board.cols)]
+        board_points_src = [sources.get(p, p) for p in board_points_dst]
+        color_indices = [self.board.board[y][x] for (x, y) in board_points_dst]
 
-        curr_ani_time = 0
-        ani_time_start = pygame.time.get_ticks()
+        def update(progress: float) -> None:
+            # All the tiles slide straight to their new cells at once
+            for p_i in range(len(board_points_dst)):
+                src_pos = self.board_pos_to_win_pos(*board_points_src[p_i])
+                dst_pos = self.board_pos_to_win_pos(*board_points_dst[p_i])
+                curr_pos = [int(src_pos[i] + (dst_pos[i] - src_pos[i]) * progress) for i in range(2)]
+                if color_indices[p_i] < 0:
+                    continue
+                self.draw_circle(curr_pos[0], curr_pos[1], self.colors[color_indices[p_i]])
 
-        while curr_ani_time <= self.hint_ani_time:
-            if self.process_events():
-                self.screen_surf.fill(self.background_color["screen"])
-                self.game_surf.fill(self.background_color["game"])
-                self.draw_sidebar()
-                win_points = (list(self.board_pos_to_win_pos(*board_points[0])), list(self.board_pos_to_win_pos(*board_points[1])))
+        self.timeline.add(Tween("shuffle", self.shuffle_ani_time, update, on_finish, board_points_dst))
 
-            self.draw_board(no_draw_pts=board_points)
+    def animate_hint(self, board_point1: tuple[int, int], board_point2: tuple[int, int]) -> None:
+        self.play_sound("hint")
 
-            curr_ani_time = pygame.time.get_ticks() - ani_time_start
+        board_points = (board_point1, board_point2)
+        color_indices = [self.board.board[y][x] for (x, y) in board_points]
 
+        def update(progress: float) -> None:
             for p_i in range(2):
-                color_index = self.board.board[board_points[p_i][1]][board_points[p_i][0]]
-                if color_index < 0:
+                if color_indices[p_i] < 0:
                     continue
-                self.draw_circle(*win_points[p_i], self.hint_color, self.circle_radius / self.circle_scale)
-                self.draw_circle(*win_points[p_i], self.colors[color_index])
+                win_point = self.board_pos_to_win_pos(*board_points[p_i])
+                self.draw_circle(*win_point, self.hint_color, self.circle_radius / self.circle_scale)
+                self.draw_circle(*win_point, self.colors[color_indices[p_i]])
 
-            pygame.display.flip()
+        self.timeline.add(Tween("hint", self.hint_ani_time, update, None, board_points))
 
-        self.update_board()
+    def animate_plus_score(self) -> None:
+        # Hide any old plus score in the sidebar for a moment and then show the new one
+        if self.plus_score_tween is not None:
+            self.timeline.remove(self.plus_score_tween)
+        self.plus_score_visible = False
+        self.draw_sidebar()
 
-    def animate_plus_score_prev(self) -> None:
-        self.curr_plus_score_ani_time = self.plus_score_ani_time + 1
-        self.update_sidebar()
-        pygame.time.wait(self.plus_score_blink_ani_time)
+        def update(progress: float) -> None:
+            if not self.plus_score_visible:
+                self.plus_score_visible = True
+                self.draw_sidebar()
 
-    def animate_plus_score_post(self) -> None:
-        self.curr_plus_score_ani_time = 0
-        self.plus_score_ani_time_start = pygame.time.get_ticks()
-        self.update_sidebar()
+        def finish() -> None:
+            self.plus_score_visible = False
+            self.plus_score_tween = None
+            self.draw_sidebar()
+
+        self.plus_score_tween = self.timeline.add(Tween("plus_score", self.plus_score_ani_time, update, finish, delay=self.plus_score_blink_ani_time))
+
+    def animate(self) -> None:
+        # Advance all the running animations by one frame
+        if not self.timeline.busy() and len(self.board_layer_points) == 0:
+            return
+        # Re-render the static board layer when the tweens moving tiles change (the board may have changed too),
+        # then restore the cells of the tiles that moved in the previous frame or that move in this one
+        board_tweens = self.timeline.board_tweens()
+        points = {p for tween in board_tweens for p in tween.points}
+        if len(points | self.board_layer_points) > 0:
+            if board_tweens != self.board_layer_tweens or self.board_layer is None or self.board_layer.get_size() != self.board_surf.get_size():
+                self.render_board_layer(points)
+            self.restore_board(points | self.board_layer_points)
+        self.board_layer_tweens = board_tweens
+        self.board_layer_points = points
+        self.timeline.advance(pygame.time.get_ticks())
+        self.update_display()
 
     ##################################################
     # Draw functions
     ##################################################
 
-    def draw_circle(self, x, y, color, radius = None) -> None:
+    def draw_circle(self, x, y, color, radius = None, surface = None) -> None:
         if radius is None:
             radius = self.circle_radius
         if color != (0, 0, 0):
-            gfxdraw.aacircle(self.board_surf, x, y, int(radius * self.circle_scale), color)
-            gfxdraw.filled_circle(self.board_surf, x, y, int(radius * self.circle_scale), color)
+            self.draw_tile_sprite(x, y, color, int(radius * self.circle_scale), surface)
         else:
-            gfxdraw.aacircle(self.board_surf, x, y, int(radius * self.circle_scale), self.border_color)
-            gfxdraw.filled_circle(self.board_surf, x, y, int(radius * self.circle_scale), self.border_color)
-            gfxdraw.aacircle(self.board_surf, x, y, int(radius * (1 - (1 - self.circle_scale) * 2)), color)
-            gfxdraw.filled_circle(self.board_surf, x, y, int(radius * (1 - (1 - self.circle_scale) * 2)), color)
+            self.draw_tile_sprite(x, y, self.border_color, int(radius * self.circle_scale), surface)
+            self.draw_tile_sprite(x, y, color, int(radius * (1 - (1 - self.circle_scale) * 2)), surface)
 
-    def draw_board(self, no_draw_pts: list[tuple[int, int]] = None) -> None:
-        self.board_surf.fill(self.background_color["board"])
+    def draw_tile_sprite(self, x, y, color, radius, surface = None) -> None:
+        if surface is None:
+            surface = self.board_surf
+        surface.blit(self.get_tile_sprite(color, radius), (x - radius, y - radius))
 
+    def draw_board(self, no_draw_pts: list[tuple[int, int]] = None, surface: pygame.Surface = None) -> None:
+        if surface is None:
+            surface = self.board_surf
+            self.mark_dirty(self.board_surf)
+        surface.fill(self.background_color["board"])
+
+        no_draw_pts = set() if no_draw_pts is None else set(no_draw_pts)
         for row in range(self.board.rows):
             for col in range(self.board.cols):
-                if no_draw_pts is not None and (col, row) in no_draw_pts:
+                if (col, row) in no_draw_pts:
                     continue
                 color_index = self.board.board[row][col]
                 if color_index < 0:
                     continue
                 pos = self.board_pos_to_win_pos(col, row)
-                self.draw_circle(pos[0], pos[1], self.colors[color_index])
+                self.draw_circle(pos[0], pos[1], self.colors[color_index], surface=surface)
+
+    def render_board_layer(self, no_draw_pts: list[tuple[int, int]]) -> None:
+        # Render the tiles that stay still during an animation only once,
+        # the animation frames just copy the cells of the moving tiles back from this layer
+        if self.board_layer is None or self.board_layer.get_size() != self.board_surf.get_size():
+            self.board_layer = pygame.Surface(self.board_surf.get_size())
+        self.draw_board(no_draw_pts, self.board_layer)
+
+    def restore_board(self, points: list[tuple[int, int]] = None) -> None:
+        if points is None:
+            self.board_surf.blit(self.board_layer, (0, 0))
+            self.mark_dirty(self.board_surf)
+            return
+        for p in points:
+            rect = self.board_pos_to_cell_rect(*p).clip(self.board_surf.get_rect())
+            self.board_surf.blit(self.board_layer, rect, rect)
+            self.mark_dirty(self.board_surf, rect)
 
     def draw_buttons(self, texts, y, y_separation, surface_name) -> None:
         surface = getattr(self, f"{surface_name}_surf")
@@ -417,11 +445,14 @@ class Match3GUI:
                     onRelease=getattr(self, f"{button_name}_clicked")
                 )
                 self.active_widgets[button_name] = button
+            else:
+                self.layout_widget(self.active_widgets[button_name], x, y_abs, width, height, border_thickness)
             self.active_widgets[button_name].draw()
             y += height + (self.char_height + self.char_sep_height) * y_separation
 
     def draw_sidebar(self) -> None:
         self.sidebar_surf.fill(self.background_color["sidebar"])
+        self.mark_dirty(self.sidebar_surf)
 
         y = (self.sidebar_surf.get_height() - (self.char_height + self.char_sep_height) * 13) / 2
         for i, text in enumerate(("SCORE", str(self.score), "TIME LEFT", str(self.time_left_sec))):
@@ -429,25 +460,23 @@ class Match3GUI:
                 y += self.char_height + self.char_sep_height
             if i == 3:
                 tc = list(self.widget_text_color)
-                gb = 255 * self.time_left_sec / (self.time_init / 1000)
+                gb = int(255 * self.time_left_sec / (self.time_init / 1000))
                 if gb > 255:
                     gb = 255
                 elif gb < 0:
                     gb = 0
                 tc[1] = gb
                 tc[2] = gb
-                label = self.font.render(text, True, tc)
+                label = self.render_text(text, tc)
             else:
-                label = self.font.render(text, True, self.widget_text_color)
+                label = self.render_text(text, self.widget_text_color)
             width = len(text) * self.char_width
             x = (self.sidebar_surf.get_width() - width) / 2
             self.sidebar_surf.blit(label, (x, y))
-            if self.curr_plus_score_ani_time <= self.plus_score_ani_time:
-                if i == 1 or i == 3:
-                    label = self.font.render("+" + str({1: self.curr_score, 3: self.curr_time_score / 1000}.get(i)), True, (255, 255, 0))
-                    x += width
-                    self.sidebar_surf.blit(label, (x, y))
-                self.curr_plus_score_ani_time = pygame.time.get_ticks() - self.plus_score_ani_time_start
+            if self.plus_score_visible and (i == 1 or i == 3):
+                label = self.render_text("+" + str({1: self.curr_score, 3: self.curr_time_score / 1000}.get(i)), (255, 255, 0))
+                x += width
+                self.sidebar_surf.blit(label, (x, y))
             y += self.char_height + self.char_sep_height
 
         y += (self.char_height + self.char_sep_height) * 3
@@ -457,6 +486,7 @@ class Match3GUI:
 
     def draw_main_menu(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         texts = ["NEW GAME", "HIGH SCORES", "PREFERENCES", "ABOUT", "EXIT"]
         if self.game_state == GameState.PAUSED:
@@ -466,6 +496,7 @@ class Match3GUI:
 
     def draw_choosesize(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         y = (self.game_surf.get_height() - (self.char_height + self.char_sep_height) * 2) / 2
         texts = ("START",)
@@ -499,17 +530,19 @@ class Match3GUI:
                 values=self.board_sizes
             )
             self.active_widgets[dropdown_name] = dropdown
-        # FIXME: When window is resized dropdown is regenerated and loses its current selection.
+        else:
+            self.layout_widget(self.active_widgets[dropdown_name], x, y_abs, width, height, border_thickness)
         self.active_widgets[dropdown_name].draw()
 
     def draw_ended(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         y = (self.game_surf.get_height() - (self.char_height + self.char_sep_height) * 9) / 2
         for i, text in enumerate(("TIME'S UP!", "YOUR SCORE:", str(self.score))):
             width = len(text) * self.char_width
             x = (self.game_surf.get_width() - width) / 2
-            label = self.font.render(text, True, self.widget_text_color)
+            label = self.render_text(text, self.widget_text_color)
             self.game_surf.blit(label, (x, y))
             y += (self.char_height + self.char_sep_height)
             if i == 0:
@@ -522,12 +555,13 @@ class Match3GUI:
 
     def draw_enterhighscore(self ) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         y = (self.game_surf.get_height() - (self.char_height + self.char_sep_height) * 11) / 2
         text = "HIGH SCORE ACHIEVED!"
         width = len(text) * self.char_width
         x = (self.game_surf.get_width() - width) / 2
-        label = self.font.render(text, True, self.widget_text_color)
+        label = self.render_text(text, self.widget_text_color)
         self.game_surf.blit(label, (x, y))
 
         y += (self.char_height + self.char_sep_height) * 3
@@ -535,7 +569,7 @@ class Match3GUI:
         text = "Enter your name:"
         width = len(text) * self.char_width
         x = (self.game_surf.get_width() - width) / 2
-        label = self.font.render(text, True, self.widget_text_color)
+        label = self.render_text(text, self.widget_text_color)
         self.game_surf.blit(label, (x, y))
 
         y += (self.char_height + self.char_sep_height) * 2
@@ -560,6 +594,8 @@ class Match3GUI:
                 onSubmit=self.ok_clicked
             )
             self.active_widgets[textbox_name] = textbox
+        else:
+            self.layout_widget(self.active_widgets[textbox_name], x, y_abs, width, height, border_thickness)
         self.active_widgets[textbox_name].draw()
 
         y += (self.char_height + self.char_sep_height) * 4
@@ -569,6 +605,7 @@ class Match3GUI:
 
     def draw_highscores(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         hsss = f"{self.high_scores_state}x{self.high_scores_state}"
 
@@ -576,7 +613,7 @@ class Match3GUI:
         for text in ("HIGH SCORES", hsss, f"Rank Name{' '*(self.high_score_name_max_len-4)} Score"):
             width = len(text) * self.char_width
             x = (self.game_surf.get_width() - width) / 2
-            label = self.font.render(text, True, self.widget_text_color)
+            label = self.render_text(text, self.widget_text_color)
             self.game_surf.blit(label, (x, y))
             y += (self.char_height + self.char_sep_height) * 2
 
@@ -590,7 +627,7 @@ class Match3GUI:
                 text = f"{cols[0]} {cols[1]} {cols[2]}"
                 width = len(text) * self.char_width
                 x = (self.game_surf.get_width() - width) / 2
-                label = self.font.render(text, True, self.widget_text_color)
+                label = self.render_text(text, self.widget_text_color)
                 self.game_surf.blit(label, (x, y))
             y += (self.char_height + self.char_sep_height)
 
@@ -627,10 +664,13 @@ class Match3GUI:
                     onRelease=getattr(self, f"{button_name}_clicked")
                 )
                 self.active_widgets[button_name] = button
+            else:
+                self.layout_widget(self.active_widgets[button_name], x, y_abs, width, height, border_thickness)
             self.active_widgets[button_name].draw()
 
     def draw_preferences(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         y = (self.game_surf.get_height() - (self.char_height + self.char_sep_height) * 12) / 2
         height = self.char_height + self.char_sep_height
@@ -643,7 +683,7 @@ class Match3GUI:
         x_toggle = x_text + text_width + spacing_width
         x_toggle_abs = x_toggle + self.game_surf.get_abs_offset()[0]
         for text in texts:
-            label = self.font.render(text, True, self.widget_text_color)
+            label = self.render_text(text, self.widget_text_color)
             self.game_surf.blit(label, (x_text, y))
             y_abs = y + self.game_surf.get_abs_offset()[1]
             toggle_name = text.lower()
@@ -658,6 +698,8 @@ class Match3GUI:
                     handleOffColour = (64, 64, 64)
                 )
                 self.active_widgets[toggle_name] = toggle
+            else:
+                self.layout_widget(self.active_widgets[toggle_name], int(x_toggle_abs), int(y_abs), int(toggle_width), int(height))
             self.active_widgets[toggle_name].draw()
             y += (self.char_height + self.char_sep_height) * 3
 
@@ -668,20 +710,39 @@ class Match3GUI:
 
     def draw_about(self) -> None:
         self.game_surf.fill(self.background_color["game"])
+        self.mark_dirty(self.game_surf)
 
         y = (self.game_surf.get_height() - (self.char_height + self.char_sep_height) * 10) / 2
         for text in ("MATCH3PY", "AUTHOR: TOMAS GONZALEZ ARAGON"):
             width = len(text) * self.char_width
             x = (self.game_surf.get_width() - width) / 2
-            label = self.font.render(text, True, self.widget_text_color)
+            label = self.render_text(text, self.widget_text_color)
             self.game_surf.blit(label, (x, y))
             y += (self.char_height + self.char_sep_height) * 4
 
         texts = ("BACK",)
         self.draw_buttons(texts, y, 0, "game")
 
+    def draw_frame_overlay(self) -> None:
+        # Render the frame time percentiles a few times per second, the last rendering is blitted on every update
+        now = pygame.time.get_ticks()
+        if self.frame_overlay_surf is None or now - self.frame_overlay_time >= self.frame_overlay_refresh_time:
+            self.frame_overlay_time = now
+            font = self.get_font(max(int(self.font_size / 2), 8))
+            labels = [font.render(line, True, (32, 255, 32)) for line in self.frame_profiler.report()]
+            width = max([label.get_width() for label in labels])
+            height = sum([label.get_height() for label in labels])
+            self.frame_overlay_surf = pygame.Surface((width + 8, height + 8))
+            y = 4
+            for label in labels:
+                self.frame_overlay_surf.blit(label, (4, y))
+                y += label.get_height()
+        self.screen_surf.blit(self.frame_overlay_surf, (0, 0))
+        self.mark_dirty(self.screen_surf, self.frame_overlay_surf.get_rect())
+
     def draw_screen(self) -> None:
         self.screen_surf.fill(self.background_color["screen"])
+        self.mark_dirty(self.screen_surf)
 
         if self.game_state == GameState.RUNNING:
             self.game_surf.fill(self.background_color["game"])
@@ -707,17 +768,40 @@ class Match3GUI:
     ##################################################
 
     def update_board(self) -> None:
-        self.draw_board()
-        pygame.display.flip()
+        with self.frame_phase("draw"):
+            self.draw_board()
+        self.update_display()
 
     def update_sidebar(self) -> None:
-        self.draw_sidebar()
-        pygame.display.flip()
-
-    def update_screen(self) -> None:
-        self.active_widgets = {}
-        self.draw_screen()
-        pygame.display.flip()
+        with self.frame_phase("draw"):
+            self.draw_sidebar()
+        self.update_display()
+
+    def update_screen(self, keep_widgets: bool = False) -> None:
+        # The widgets of the previous screen are discarded, unless it's the same screen being redrawn (e.g. resize)
+        if not keep_widgets:
+            self.active_widgets = {}
+        with self.frame_phase("draw"):
+            self.draw_screen()
+        self.widget_dispatcher.snapshot(self.active_widgets)
+        self.update_display()
+
+    def update_display(self) -> None:
+        if self.frame_overlay:
+            self.draw_frame_overlay()
+        # Push only the regions that were drawn since the last update
+        if len(self.dirty_rects) == 0:
+            return
+        with self.frame_phase("display"):
+            screen_rect = self.screen_surf.get_rect()
+            if any([rect.contains(screen_rect) for rect in self.dirty_rects]):
+                pygame.display.flip()
+            else:
+                pygame.display.update(self.dirty_rects)
+            self.dirty_rects = []
+        # Time from the swap until its first frame is shown
+        if self.move_start is not None and self.move_latency is None:
+            self.move_latency = time.perf_counter() - self.move_start
 
     ##################################################
     # On click functions
@@ -731,22 +815,40 @@ class Match3GUI:
         size = self.active_widgets["choose_board_size"].getSelected()
         if size is None:
             return
-        num_values = size - 1
-        if size > 7:
-            num_values -= 1
-        if size > 10:
-            num_values -= 1
-        self.board = Match3Board(size, size, num_values)
+        self.end_replay()
+        self.start_game(size)
+
+    def start_game(self, size: int, seed: int = None) -> None:
+        num_values = Match3Game.num_values_for_size(size)
+        # The seed is recorded in the move log so the game can be replayed
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.board = Match3Board(size, size, num_values, seed)
+        self.move_log = Match3MoveLog(size, size, num_values, seed, self.time_init)
+        self.replay_index = 0
+        self.board_changed()
+        self.num_plays = None
+        self.regenerating = False
+        self.regenerated_board = None
         self.score = 0
         self.time_left = self.time_init
         self.time_score = 0
         self.time_left_sec = int(self.time_left / 1000)
         self.hint = False
         self.hint_cut_score = False
-        self.plus_score_ani_time_start = 0
-        self.curr_plus_score_ani_time = self.plus_score_ani_time + 1
+        self.plus_score_visible = False
+        self.plus_score_tween = None
         self.curr_score = 0
         self.curr_time_score = 0
+        self.cascading = False
+        self.cascade_bonus = 0
+        self.cascade_bonus_score = 0
+        self.move_start = None
+        self.num_moves = 0
+        self.num_hints = 0
+        self.num_regenerations = 0
+        self.telemetry.emit("game_start", size=size, num_values=num_values)
+        self.timeline.clear()
         self.time_paused = 0
         self.pause = False
         self.game_state = GameState.RUNNING
@@ -756,7 +858,8 @@ class Match3GUI:
         self.time_start = pygame.time.get_ticks()
 
     def hint_clicked(self) -> None:
-        self.hint = True
+        if self.replay is None:
+            self.hint = True
 
     def pause_clicked(self) -> None:
         self.pause = True
@@ -768,6 +871,12 @@ class Match3GUI:
         self.time_paused += pygame.time.get_ticks() - self.pause_time
 
     def continue_clicked(self) -> None:
+        # Replayed games don't go to the high scores
+        if self.replay is not None:
+            self.end_replay()
+            self.game_state = GameState.MAINMENU
+            self.update_screen()
+            return
         min_hs = 0
         hs = self.high_scores.get(f"{self.board.cols}x{self.board.rows}", list())
         if len(hs) > 0:
@@ -784,14 +893,9 @@ class Match3GUI:
         # TODO: Sanitize name.
         if len(name) == 0:
             return
-        hs = self.high_scores.get(f"{self.board.cols}x{self.board.rows}", list())
-        hs.append([name, self.score])
-        hs.sort(key=lambda d: d[1], reverse=True)
-        if len(hs) > 5:
-            del hs[-1]
-        self.high_scores[f"{self.board.cols}x{self.board.rows}"] = hs
-        with open(self.high_scores_filename, 'w') as f:
-            json.dump(self.high_scores, f)
+        size = f"{self.board.cols}x{self.board.rows}"
+        self.score_store.add(size, name, self.score, self.move_log.encode())
+        self.high_scores[size] = self.score_store.top(size)
         self.game_state = GameState.MAINMENU
         self.update_screen()
 
@@ -835,32 +939,130 @@ class Match3GUI:
         self.update_screen()
 
     def exit_clicked(self) -> None:
-        pygame.quit()
+        self.shutdown()
         exit()
 
     ##################################################
     # Helper functions
     ##################################################
 
+    def build_board_grid(self) -> None:
+        # Precompute the tile centers and cell rects of the board surface, shared by the drawing and the input
+        self.col_w = self.board_surf.get_width() / self.board.cols
+        self.row_h = self.board_surf.get_height() / self.board.rows
+        self.board_offset = self.board_surf.get_abs_offset()
+        self.cell_bounds_x = [int(col * self.col_w) for col in range(self.board.cols + 1)]
+        self.cell_bounds_y = [int(row * self.row_h) for row in range(self.board.rows + 1)]
+        self.tile_centers = [[self.calc_tile_center(col, row) for col in range(self.board.cols)] for row in range(self.board.rows)]
+        self.cell_rects = [[self.calc_cell_rect(col, row) for col in range(self.board.cols)] for row in range(self.board.rows)]
+
+    def calc_tile_center(self, board_pos_x: int, board_pos_y: int) -> tuple[int, int]:
+        return (int(board_pos_x * self.col_w + self.col_w / 2), int(board_pos_y * self.row_h + self.row_h / 2))
+
+    def calc_cell_rect(self, board_pos_x: int, board_pos_y: int) -> pygame.Rect:
+        x = int(board_pos_x * self.col_w)
+        y = int(board_pos_y * self.row_h)
+        return pygame.Rect(x, y, int((board_pos_x + 1) * self.col_w) - x, int((board_pos_y + 1) * self.row_h) - y)
+
     def win_pos_to_board_pos(self, win_pos_x: int, win_pos_y: int, relative_to_window: bool = False) -> tuple[int, int]:
         if relative_to_window:
-            win_pos_x -= self.board_surf.get_abs_offset()[0]
-            win_pos_y -= self.board_surf.get_abs_offset()[1]
-        col_w = self.board_surf.get_width() / self.board.cols
-        row_h = self.board_surf.get_height() / self.board.rows
-        board_pos_x = (win_pos_x - col_w / 2) / col_w
-        board_pos_y = (win_pos_y - row_h / 2) / row_h
-        return (int(round(board_pos_x)), int(round(board_pos_y)))
+            win_pos_x -= self.board_offset[0]
+            win_pos_y -= self.board_offset[1]
+        return (bisect.bisect_right(self.cell_bounds_x, win_pos_x) - 1, bisect.bisect_right(self.cell_bounds_y, win_pos_y) - 1)
 
     def board_pos_to_win_pos(self, board_pos_x: int, board_pos_y: int, relative_to_window: bool = False) -> tuple[int, int]:
-        col_w = self.board_surf.get_width() / self.board.cols
-        row_h = self.board_surf.get_height() / self.board.rows
-        win_pos_x = board_pos_x * col_w + col_w / 2
-        win_pos_y = board_pos_y * row_h + row_h / 2
+        if 0 <= board_pos_x < self.board.cols and 0 <= board_pos_y < self.board.rows:
+            win_pos = self.tile_centers[board_pos_y][board_pos_x]
+        else:
+            # Tiles falling into the board from above
+            win_pos = self.calc_tile_center(board_pos_x, board_pos_y)
         if relative_to_window:
-            win_pos_x += self.board_surf.get_abs_offset()[0]
-            win_pos_y += self.board_surf.get_abs_offset()[1]
-        return (int(win_pos_x), int(win_pos_y))
+            return (win_pos[0] + self.board_offset[0], win_pos[1] + self.board_offset[1])
+        return win_pos
+
+    def board_pos_to_cell_rect(self, board_pos_x: int, board_pos_y: int) -> pygame.Rect:
+        if 0 <= board_pos_x < self.board.cols and 0 <= board_pos_y < self.board.rows:
+            return self.cell_rects[board_pos_y][board_pos_x]
+        return self.calc_cell_rect(board_pos_x, board_pos_y)
+
+    def mark_dirty(self, surface: pygame.Surface, rect = None) -> None:
+        if rect is None:
+            rect = surface.get_rect()
+        rect = pygame.Rect(rect).move(surface.get_abs_offset())
+        self.dirty_rects.append(rect.clip(self.screen_surf.get_rect()))
+
+    def get_tile_sprite(self, color: tuple[int, int, int], radius: int) -> pygame.Surface:
+        key = (tuple(color), radius)
+        if key in self.tile_sprites:
+            self.tile_sprites.move_to_end(key)
+            return self.tile_sprites[key]
+        # Rasterize the anti-aliased circle in white over black to get its coverage,
+        # then use the coverage as the alpha channel of a surface of the given color
+        size = radius * 2 + 1
+        mask = pygame.Surface((size, size))
+        gfxdraw.aacircle(mask, radius, radius, radius, (255, 255, 255))
+        gfxdraw.filled_circle(mask, radius, radius, radius, (255, 255, 255))
+        pixels = bytearray(bytes((*color, 0)) * (size * size))
+        pixels[3::4] = pygame.image.tostring(mask, "RGB")[0::3]
+        sprite = pygame.image.fromstring(bytes(pixels), (size, size), "RGBA").convert_alpha()
+        self.tile_sprites[key] = sprite
+        # Evict the least recently used sprite
+        if len(self.tile_sprites) > self.tile_sprite_cache_size:
+            self.tile_sprites.popitem(last=False)
+        return sprite
+
+    def layout_widget(self, widget, x, y, width, height, border_thickness = 0) -> None:
+        # Move and scale an existing widget to the current screen size instead of creating a new one, so it keeps
+        # its state (e.g. the dropdown selection or the text box contents)
+        if (widget.getX(), widget.getY(), widget.getWidth(), widget.getHeight()) == (x, y, width, height):
+            return
+        widget.setX(x)
+        widget.setY(y)
+        widget.setWidth(width)
+        widget.setHeight(height)
+        if type(widget) == pygamew.Button:
+            widget.font = self.font
+            widget.text = self.render_text(widget.string, widget.textColour)
+            widget.textRect = widget.text.get_rect()
+            widget.alignTextRect()
+            widget.shadowDistance = self.char_sep_height // 2
+            widget.borderThickness = border_thickness
+        elif type(widget) == pygamew.Dropdown:
+            # The head and the choices of the dropdown are positioned relative to it
+            parts = [widget._Dropdown__main] + widget._Dropdown__choices
+            for i, part in enumerate(parts):
+                part.setY(i * height)
+                part.setWidth(width)
+                part.setHeight(height)
+                part.font = self.font
+                part.borderThickness = border_thickness
+        elif type(widget) == pygamew.TextBox:
+            widget.font = self.font
+            widget.borderThickness = border_thickness
+        elif type(widget) == pygamew.Toggle:
+            widget.radius = height // 2
+            widget.handleRadius = int(height / 1.3)
+        self.widget_dispatcher.stale = True
+
+    def get_font(self, size: int) -> pygame.font.Font:
+        # Looking up a system font is slow, load each size only once
+        if size not in self.fonts:
+            font = pygame.font.SysFont("monospace", size)
+            font.set_bold(True)
+            self.fonts[size] = font
+        return self.fonts[size]
+
+    def render_text(self, text: str, color: tuple[int, int, int]) -> pygame.Surface:
+        key = (text, int(self.font_size), tuple(color))
+        if key in self.labels:
+            self.labels.move_to_end(key)
+            return self.labels[key]
+        label = self.font.render(text, True, color)
+        self.labels[key] = label
+        # Evict the least recently used label
+        if len(self.labels) > self.label_cache_size:
+            self.labels.popitem(last=False)
+        return label
 
     def point_inside_circle(self, point: tuple[int, int], circle_center: tuple[int, int], r: float) -> bool:
         x, y = point
@@ -874,15 +1076,25 @@ class Match3GUI:
         return max(points_in_line.values())
 
     def play_sound(self, sound: str) -> None:
-        if self.preferences.get("sound_effects", True) and sound in self.sounds:
-            pygame.mixer.Sound.play(self.sounds[sound])
+        if self.preferences.get("sound_effects", True):
+            latency = self.audio.play(sound)
+            if latency is not None:
+                self.frame_profiler.record("audio_latency_estimate", latency)
 
     def start_music(self) -> None:
-        if self.preferences.get("background_music", True):
+        if not self.preferences.get("background_music", True):
+            return
+        # The music is streamed from the file, opening it is cheap so it's done on the main thread the first time
+        if not self.music_loaded:
+            if not os.path.isfile(self.background_music_filename):
+                return
             try:
-                pygame.mixer.music.play(-1, 0, 1000)
-            except:
-                pass
+                pygame.mixer.music.load(self.background_music_filename)
+            except pygame.error as e:
+                print(f"ERROR: In file {self.background_music_filename}: {e}")
+                return
+            self.music_loaded = True
+        pygame.mixer.music.play(-1, 0, 1000)
 
     ##################################################
     # Other functions
@@ -891,6 +1103,7 @@ class Match3GUI:
     def resize_surfaces(self) -> None:
         # Calculate new screen size
         sw, sh = self.screen_surf.get_size()
+        circle_radius = self.circle_radius
         gw, gh = sw, sh
         gx, gy = 0, 0
         if sw / sh > self.game_ratio:
@@ -906,6 +1119,7 @@ class Match3GUI:
         self.board_surf = self.game_surf.subsurface((pos, pos, side, side))
         if self.board is not None:
             self.circle_radius = self.board_surf.get_height() / self.board.cols / 2
+            self.build_board_grid()
         # Calculate and update new sidebar size
         self.sidebar_surf = self.game_surf.subsurface((gh, 0, gw - gh, gh))
         # Calculate and update new font size
@@ -913,38 +1127,44 @@ class Match3GUI:
         self.char_width = self.min_char_width * self.game_surf.get_width() / self.starting_width
         self.char_height = self.min_char_height * self.game_surf.get_height() / self.starting_height
         self.char_sep_height = self.min_char_sep_height * self.game_surf.get_height() / self.starting_height
-        self.font = pygame.font.SysFont("monospace", int(self.font_size))
-        self.font.set_bold(True)
-        # Clear active widgets to force a re-draw
-        self.active_widgets = {}
+        self.font = self.get_font(int(self.font_size))
+        # The tile sprites depend on the circle radius, the active widgets are moved and scaled when drawn
+        if self.circle_radius != circle_radius:
+            self.tile_sprites.clear()
 
     ##################################################
     # Process events functions
     ##################################################
 
     def choosesize_process_events(self, events, **kwargs) -> bool:
-        self.active_widgets["choose_board_size"].listen(events)
-        self.draw_choosesize()
+        if "choose_board_size" in kwargs["targets"]:
+            self.active_widgets["choose_board_size"].listen(events)
+        if not self.widget_dispatcher.changed(self.active_widgets, ("choose_board_size",)):
+            return False
         if self.active_widgets["choose_board_size"].dropped:
             self.active_widgets["start"].hide()
         else:
             self.active_widgets["start"].show()
+        with self.frame_phase("draw"):
+            self.draw_choosesize()
+        self.widget_dispatcher.snapshot(self.active_widgets)
         return True
 
     def running_process_events(self, events, **kwargs) -> bool:
-        # End the game if the time has run out
-        if self.time_left <= 0:
-            self.game_ended = True
-
         update_display = False
 
         # Update the time left
-        self.time_left = self.time_paused + self.time_init + self.time_score - (pygame.time.get_ticks() - self.time_start)
+        self.time_left = Match3Game.calc_time_left(self.time_init, self.time_score, pygame.time.get_ticks() - self.time_start - self.time_paused)
+
+        # End the game if the time has run out, the board is locked from now on so no move is made after the end
+        if self.time_left <= 0 and not self.replay_pending():
+            self.game_ended = True
         if self.time_left_sec != int(round(self.time_left / 1000)):
             self.time_left_sec = int(round(self.time_left / 1000))
             if self.time_left_sec < 0:
                 self.time_left_sec = 0
-            self.draw_sidebar()
+            with self.frame_phase("draw"):
+                self.draw_sidebar()
             update_display = True
 
         # Play beep sound
@@ -953,13 +1173,6 @@ class Match3GUI:
                 self.last_beep_sound_time = pygame.time.get_ticks()
                 self.play_sound("beep")
 
-        # Remove plus score from sidebar if the ani time is up
-        if self.curr_plus_score_ani_time <= self.plus_score_ani_time:
-            self.curr_plus_score_ani_time = pygame.time.get_ticks() - self.plus_score_ani_time_start
-            if self.curr_plus_score_ani_time > self.plus_score_ani_time:
-                self.draw_sidebar()
-                update_display = True
-
         # Process events
         if not kwargs.get('mouse', False):
             return
@@ -967,7 +1180,7 @@ class Match3GUI:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button != 1:
                     continue
-                if self.mouse_state == MouseState.WAITING:
+                if self.mouse_state == MouseState.WAITING and not self.board_locked() and self.replay is None:
                     self.board_pos_src = self.win_pos_to_board_pos(*event.pos, True)
                     if self.board.out_of_bounds(*self.board_pos_src):
                         continue
@@ -1003,13 +1216,8 @@ class Match3GUI:
                     if not swap_valid:
                         self.mouse_state = MouseState.WAITING
                         continue
-                    # Do the swap, if it was not a valid play, revert it
-                    swap_valid = self.board.is_swap_valid(self.board_pos_src, board_pos_dst)
-                    self.animate_swap(self.board_pos_src, tuple(board_pos_dst))
-                    self.board.swap(self.board_pos_src, board_pos_dst)
-                    if not swap_valid:
-                        self.animate_swap(tuple(board_pos_dst), self.board_pos_src)
-                        self.board.swap(board_pos_dst, self.board_pos_src)
+                    if not self.board_locked():
+                        self.swap(self.board_pos_src, tuple(board_pos_dst))
                     self.mouse_state = MouseState.WAITING
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button != 1:
@@ -1022,31 +1230,67 @@ class Match3GUI:
         return update_display
 
     def enterhighscore_process_events(self, events, **kwargs) -> bool:
+        # The text box has the keyboard focus, it listens to all the events
         self.active_widgets["high_score_name"].listen(events)
-        self.draw_screen()
+        if self.game_state != GameState.ENTERHIGHSCORE:
+            # The name was submitted
+            return False
+        if not self.widget_dispatcher.changed(self.active_widgets, ("high_score_name",)):
+            return False
+        with self.frame_phase("draw"):
+            self.draw_screen()
+        self.widget_dispatcher.snapshot(self.active_widgets)
         return True
 
     def preferences_process_events(self, events, **kwargs) -> bool:
-        self.active_widgets["background_music"].listen(events)
-        self.active_widgets["sound_effects"].listen(events)
-        self.draw_screen()
+        names = [name for name in ("background_music", "sound_effects") if name in kwargs["targets"]]
+        for name in names:
+            self.active_widgets[name].listen(events)
+        if not self.widget_dispatcher.changed(self.active_widgets, names):
+            return False
+        with self.frame_phase("draw"):
+            self.draw_screen()
+        self.widget_dispatcher.snapshot(self.active_widgets)
         return True
 
-    def process_events(self, fps: int = -1, **kwargs) -> bool:
-        # Wait until frame time
-        if fps < 0:
-            fps = self.ani_fps
-        self.clock.tick(fps)
-
+    def process_events(self, events: list = None, **kwargs) -> bool:
         # Process generic events
-        events = pygame.event.get()
+        redraw = False
+        if events is None:
+            events = pygame.event.get()
+        # The input received while a resize was pending goes first, in the order it was received
+        if not self.resize_pending and len(self.resize_events) > 0:
+            events = self.resize_events + list(events)
+            self.resize_events = []
+        input_events = []
         for event in events:
-            if event.type == pygame.VIDEORESIZE:
-                self.resize_surfaces()
-                return True
+            if event.type == pygame.KEYDOWN and event.key == self.frame_overlay_key:
+                # Redraw the screen below the overlay when it's hidden
+                self.frame_overlay = not self.frame_overlay
+                self.frame_overlay_surf = None
+                redraw = not self.frame_overlay
+            elif event.type == pygame.VIDEORESIZE and self.render_size is None:
+                # Coalesce the resize events received while the window is being dragged
+                self.resize_pending = True
+                self.resize_time = pygame.time.get_ticks()
             elif event.type == pygame.QUIT:
-                pygame.quit()
+                self.shutdown()
                 exit()
+            else:
+                input_events.append(event)
+
+        # Resize once the window size has settled, the surfaces must not be drawn until then
+        # The input is kept until the widgets are laid out for the new size, and routed in the next frame
+        if self.resize_pending:
+            self.resize_events += input_events
+            if pygame.time.get_ticks() - self.resize_time < self.resize_debounce_time:
+                return False
+            self.resize_pending = False
+            self.resize_surfaces()
+            return True
+
+        # Route the mouse events only to the widgets under the cursor
+        targets = self.widget_dispatcher.route(events, self.active_widgets, pygame.mouse.get_pos())
 
         # Process specific events related to the current game state
         gs = self.game_state.name
@@ -1057,154 +1301,474 @@ class Match3GUI:
             func = None
         update_display = False
         if func is not None:
-            update_display = func(events, **kwargs)
+            update_display = func(events, targets=targets, **kwargs)
 
-        # Listen to button events
-        for button in self.active_widgets.values():
+        # Listen to button events, redraw the buttons whose state changed
+        for name in targets:
+            button = self.active_widgets.get(name)
             if type(button) == pygamew.Button:
-                color = button.colour
                 button.listen(events)
-                if color != button.colour:
-                    button.draw()
+                if self.active_widgets.get(name) is not button:
+                    # The button click changed the screen
+                    break
+                if self.widget_dispatcher.changed(self.active_widgets, (name,)):
+                    with self.frame_phase("draw"):
+                        button.draw()
+                    self.widget_dispatcher.snapshot(self.active_widgets, (name,))
+                    self.mark_dirty(self.screen_surf, (button.getX(), button.getY(), button.getWidth() + button.shadowDistance, button.getHeight() + button.shadowDistance))
                     update_display = True
 
         if update_display:
-            pygame.display.flip()
+            self.update_display()
 
-        return False
+        return redraw
 
     ##################################################
     # Main game loop functions
     ##################################################
 
+    def board_locked(self) -> bool:
+        return self.game_ended or self.cascading or self.regenerating or self.timeline.board_busy()
+
+    def board_changed(self) -> None:
+        # The results of the jobs submitted for the previous board state are stale, cancel them
+        self.board_generation += 1
+        self.play = None
+        for job in self.worker_jobs.values():
+            job.cancel()
+        self.worker_jobs = {}
+
+    def submit_job(self, name: str, func) -> None:
+        # Run func on a copy of the board in the worker thread, the result is handed back through the results queue
+        generation = self.board_generation
+        board = self.board.copy()
+
+        def job() -> None:
+            self.worker_results.put((generation, name, func(board)))
+            # Wake up the main loop if it's idle
+            pygame.event.post(pygame.event.Event(self.worker_event))
+
+        self.worker_jobs[name] = self.worker.submit(job)
+
+    def poll_jobs(self) -> None:
+        # Collect the results of the finished jobs, dropping the ones computed for a previous board state
+        while True:
+            try:
+                (generation, name, result) = self.worker_results.get_nowait()
+            except queue.Empty:
+                return
+            if generation != self.board_generation:
+                continue
+            self.worker_jobs.pop(name, None)
+            if name == "play":
+                (self.play, self.num_plays) = result
+            elif name == "board":
+                if result[0] is None:
+                    print(f"FATAL: Couldn't regenerate the the board.")
+                    self.shutdown()
+                    exit(1)
+                self.regenerated_board = result
+
+    @staticmethod
+    def find_play_job(board: Match3Board) -> tuple[tuple, int]:
+        # A play for the hint and the number of plays left, the board is reshuffled when it gets to 0
+        return (board.find_a_play(), board.count_plays())
+
+    @staticmethod
+    def regenerate_job(board: Match3Board) -> tuple[Match3Board, list[tuple[tuple[int, int], tuple[int, int]]]]:
+        # Same as Match3Game.regenerate(), the moves of the reshuffled tiles are animated
+        moves = board.reshuffle()
+        if len(moves) == 0:
+            board.clear()
+            try:
+                board.populate()
+            except RecursionError:
+                return (None, moves)
+        return (board, moves)
+
+    def swap(self, board_point1: tuple[int, int], board_point2: tuple[int, int]) -> None:
+        # Do the swap, if it was not a valid play, revert it
+        swap_valid = self.board.is_swap_valid(board_point1, board_point2)
+
+        def swapped() -> None:
+            self.board.swap(board_point1, board_point2)
+            self.board_changed()
+            if not swap_valid:
+                self.animate_swap(board_point2, board_point1, on_finish=reverted)
+
+        def reverted() -> None:
+            self.board.swap(board_point2, board_point1)
+            self.board_changed()
+
+        self.cascading = swap_valid
+        self.move_log.add_swap(self.game_time(), board_point1, board_point2)
+        self.move_start = time.perf_counter()
+        self.move_latency = None
+        self.move_valid = swap_valid
+        self.move_depth = 0
+        self.move_score = 0
+        self.num_moves += 1
+        self.animate_swap(board_point1, board_point2, on_finish=swapped)
+
+    def cascade_clear(self, points: list[tuple[int, int]]) -> None:
+        # Shift down the tiles that are floating and create new tiles in the empty spaces left at the top,
+        # the whole new board state is computed first so that all the tiles fall in a single animation
+        self.board.clear(points)
+        moves = self.board.collapse()
+        self.board_changed()
+        self.animate_fall(moves, self.get_num_vertical_points(points), on_finish=self.cascade_dropped)
+
+    def cascade_dropped(self) -> None:
+        self.play_sound("drop")
+        self.cascade_bonus += 1
+        self.cascade_bonus_score += self.cascade_bonus
+
     def running(self) -> None:
+        # The board state can't change while its tiles are being animated
+        if self.timeline.board_busy():
+            return
+
+        # Show the reshuffled board once the worker has it ready
+        if self.regenerating:
+            if self.regenerated_board is None:
+                return
+            # Keep the random generator state of the reshuffled board too, as if it was reshuffled in place
+            (board, moves) = self.regenerated_board
+            self.board.board = board.board
+            self.board.random = board.random
+            self.regenerated_board = None
+            self.regenerating = False
+            self.board_changed()
+            if len(moves) > 0:
+                self.animate_shuffle(moves)
+                return
+            self.update_board()
+
         # Let the computer play (for debug)
-        # play = self.board.find_better_play()
-        # if len(play) > 0:
-        #     (swap_points, groups) = play
-        #     self.animate_swap(swap_points[0], swap_points[1])
-        #     self.board.swap(swap_points[0], swap_points[1])
+        # if not self.cascading:
+        #     play = self.board.find_better_play()
+        #     if len(play) > 0:
+        #         (swap_points, groups) = play
+        #         self.swap(swap_points[0], swap_points[1])
+        #         return
 
         # Find all the match3 groups and update the board state by
         # clearing them and then filling the board with new tiles from the top
         # while shifting down the ones floating
         # Do this until the board state is stabilized
+        # Each step is animated without blocking, the next one starts when the animations are done
         groups = self.board.get_valid_groups()
-        bonus_score = 0
-        bonus = 0
-        while len(groups) > 0:
-            # Clear any old plus score in the sidbar
-            self.animate_plus_score_prev()
+        if len(groups) > 0:
+            self.cascading = True
             # Calculate the score from the match3 groups, add extra time poportional to the score
-            self.curr_score = self.board.calc_score(groups) + bonus_score
-            group_bonus_score = 0
-            group_bonus = 0
-            for _ in range(len(groups) - 1):
-                group_bonus += 1
-                group_bonus_score += group_bonus
-            self.curr_time_score = ((self.curr_score + bonus_score + group_bonus_score) * 100)
-            if self.hint_cut_score:
-                self.curr_score //= 2
-                self.curr_time_score = self.curr_score * 100
-                self.hint_cut_score = False
+            (self.curr_score, self.curr_time_score) = Match3Game.calc_move_score(self.board, groups, self.cascade_bonus_score, self.hint_cut_score)
+            hint_cut_score = self.hint_cut_score
+            self.hint_cut_score = False
             self.score += self.curr_score
             self.time_score += self.curr_time_score
+            self.move_depth += 1
+            self.move_score += self.curr_score
+            self.telemetry.emit("score", depth=self.move_depth, groups=len(groups), score=self.curr_score,
+                                time_score=self.curr_time_score, hint_cut=hint_cut_score)
             # Show plus score in the sidebar
-            self.animate_plus_score_post()
+            self.animate_plus_score()
             # Clear the tiles that create a match3 group
             points = [point for group in groups for point in group]
-            self.animate_clear(points)
-            self.board.clear(points)
-            # Shift down the tiles that are floating and create new tiles in the top row
-            # Do this until the board is filled
-            while not self.board.is_full():
-                shifted = self.board.shift_down()
-                shifted += self.board.populate(rows=[0, 1], no_valid_play_check=False, no_match3_group_check=False)
-                self.animate_shift_down(shifted, self.get_num_vertical_points(points))
-            self.play_sound("drop")
-            groups = self.board.get_valid_groups()
-            bonus += 1
-            bonus_score += bonus
-
-        # Check if there is a valid play, if not, regenerate the board
-        play = self.board.find_a_play()
-        if len(play) == 0:
-            self.animate_clear([(x, y) for y in range(self.board.rows) for x in range(self.board.cols)], True)
-            self.board.clear()
-            try:
-                self.board.populate()
-            except RecursionError:
-                print(f"FATAL: Couldn't regenerate the the board.")
-                pygame.quit()
-                exit(1)
-            self.update_board()
+            self.animate_clear(points, on_finish=lambda: self.cascade_clear(points))
+            return
+        self.cascading = False
+        self.cascade_bonus = 0
+        self.cascade_bonus_score = 0
+        if self.move_start is not None:
+            self.emit_move()
+
+        # The game ends as soon as the cascade of the last move has settled, before waiting for a play or a new board
+        if self.game_ended:
+            self.end_game()
+            return
+
+        # Check if there is a valid play, if not, reshuffle the board
+        # Both are computed by the worker, the board is locked until the reshuffled one is ready
+        if self.play is None:
+            if "play" not in self.worker_jobs:
+                self.submit_job("play", self.find_play_job)
+            return
+        if len(self.play) == 0:
+            self.regenerating = True
+            self.num_regenerations += 1
+            self.telemetry.emit("regenerate", count=self.num_regenerations)
+            self.submit_job("board", self.regenerate_job)
+            return
 
         if self.hint:
             self.hint = False
-            play = self.board.find_a_play()
-            if len(play) > 0:
-                (swap_points, groups) = play
-                self.animate_hint(*swap_points)
+            self.num_hints += 1
+            self.telemetry.emit("hint", count=self.num_hints)
+            self.move_log.add_hint(self.game_time())
+            (swap_points, groups) = self.play
+            self.animate_hint(*swap_points)
             self.hint_cut_score = True
-        if self.game_ended:
-            self.game_ended = False
-            self.game_state = GameState.ENDED
-            self.play_sound("end")
-            pygame.mixer.music.fadeout(1000)
-            self.update_screen()
-        elif self.pause:
+            return
+        if self.pause:
             self.pause = False
             self.game_state = GameState.PAUSED
             self.music_pos = pygame.mixer.music.get_pos()
             pygame.mixer.music.fadeout(1000)
             self.update_screen()
             self.pause_time = pygame.time.get_ticks()
+        elif self.replay is not None:
+            self.replay_move()
+
+    def end_game(self) -> None:
+        self.game_ended = False
+        self.game_state = GameState.ENDED
+        self.telemetry.emit("game_end", size=self.board.cols, score=self.score, moves=self.num_moves,
+                            hints=self.num_hints, regenerations=self.num_regenerations)
+        self.move_log.score = self.score
+        if self.replay is None:
+            self.save_move_log()
+        self.play_sound("end")
+        pygame.mixer.music.fadeout(1000)
+        self.update_screen()
+
+    def game_time(self) -> int:
+        # Time since the start of the game, pauses excluded
+        return pygame.time.get_ticks() - self.time_start - self.time_paused
+
+    def end_replay(self) -> None:
+        # The game length of the replay only applies to the replayed game
+        if self.replay is not None:
+            self.time_init = self.replay_time_init
+        self.replay = None
+
+    def replay_pending(self) -> bool:
+        return self.replay is not None and self.replay_index < len(self.replay.moves)
+
+    def replay_move(self) -> None:
+        # Play back the next move of the replay once its time has come, the board is ready for it at this point
+        if not self.replay_pending():
+            return
+        (time_game, kind, x1, y1, x2, y2) = self.replay.moves[self.replay_index]
+        if self.game_time() < time_game:
+            return
+        self.replay_index += 1
+        if kind == Match3MoveLog.hint_move:
+            self.hint = True
+        else:
+            self.swap((x1, y1), (x2, y2))
+
+    def save_move_log(self) -> None:
+        if self.replays_dir is None:
+            return
+        filename = f"{self.replays_dir}/{time.strftime('%Y%m%d-%H%M%S')}-{self.board.cols}x{self.board.rows}-{self.score}.m3r"
+        try:
+            os.makedirs(self.replays_dir, exist_ok=True)
+            self.move_log.save(filename)
+        except OSError:
+            print(f"ERROR: Couldn't save the move log to {filename}.")
+
+    def animating(self) -> bool:
+        # The tweens are only advanced while the game is running, the ones left when it's paused or ended wait for it
+        return self.game_state == GameState.RUNNING and self.timeline.busy()
+
+    def idle_timeout(self) -> int:
+        # Time until the next scheduled change of the screen, None if it has to be updated every frame
+        if not self.idle_mode or self.animating():
+            return None
+        now = pygame.time.get_ticks()
+        timeouts = [self.idle_max_timeout]
+        if self.resize_pending:
+            timeouts.append(self.resize_time + self.resize_debounce_time - now)
+        elif len(self.resize_events) > 0:
+            return None
+        if self.frame_overlay:
+            timeouts.append(self.frame_overlay_time + self.frame_overlay_refresh_time - now)
+        if self.game_state == GameState.RUNNING:
+            if self.cascading or self.hint or self.pause or self.game_ended:
+                return None
+            # Next second shown by the timer, end of the game and next beep
+            time_left = Match3Game.calc_time_left(self.time_init, self.time_score, now - self.time_start - self.time_paused)
+            timeouts.append(time_left - (round(time_left / 1000) - 0.5) * 1000)
+            if time_left > 0:
+                timeouts.append(time_left)
+            if self.time_left_sec <= 5:
+                timeouts.append(self.last_beep_sound_time + 1000 - now)
+            if self.replay_pending():
+                timeouts.append(self.replay.moves[self.replay_index][0] - (now - self.time_start - self.time_paused))
+        elif self.game_state == GameState.ENTERHIGHSCORE:
+            # Key repeat and cursor blink of the text box
+            textbox = self.active_widgets["high_score_name"]
+            if textbox.keyDown:
+                return None
+            if textbox.selected:
+                timeouts.append((textbox.cursorTime + textbox.CURSOR_INTERVAL / 1000 - time.time()) * 1000)
+        return max(math.ceil(min(timeouts)), 1)
+
+    def wait_events(self, timeout: int) -> list:
+        event = pygame.event.wait(timeout)
+        if event.type == pygame.NOEVENT:
+            return pygame.event.get()
+        return [event] + pygame.event.get()
+
+    def frame_phase(self, phase: str):
+        return self.frame_profiler.phase(phase)
+
+    def profile(self, phase: str):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(phase)
+
+    def validate_files(self) -> None:
+        # The files are already loaded, validating them is deferred until the first frame has been shown
+        import jsonschema
+        if not os.path.isfile(self.preferences_filename):
+            return
+        try:
+            jsonschema.validate(self.preferences, self.preferences_schema)
+        except jsonschema.ValidationError:
+            print(f"ERROR: In file {self.preferences_filename}: json doesn't conform to schema.")
+
+    def load_high_scores(self) -> None:
+        self.score_store = Match3ScoreStore(self.high_scores_db_filename)
+        # Import the high scores saved as json by the previous versions the first time the database is created
+        if self.score_store.count() == 0 and os.path.isfile(self.high_scores_filename):
+            import jsonschema
+            try:
+                with open(self.high_scores_filename, 'r') as file:
+                    high_scores = json.load(file)
+                Match3ScoreStore.validate_json(high_scores)
+                self.score_store.import_scores(high_scores)
+            except json.JSONDecodeError:
+                print(f"ERROR: In file {self.high_scores_filename}: json not valid.")
+            except jsonschema.ValidationError:
+                print(f"ERROR: In file {self.high_scores_filename}: json doesn't conform to schema.")
+        # Only the top scores of each board size are shown
+        self.high_scores = {f"{n}x{n}": self.score_store.top(f"{n}x{n}") for n in self.board_sizes}
+
+    def emit_move(self) -> None:
+        # The move is over once its cascade has settled
+        duration = time.perf_counter() - self.move_start
+        latency = self.move_latency if self.move_latency is not None else duration
+        # The plays are the ones the board had when the move was made, the next count comes after the move
+        self.telemetry.emit("move", valid=self.move_valid, latency=round(latency * 1000, 3),
+                            duration=round(duration * 1000, 3), depth=self.move_depth, score=self.move_score,
+                            plays=self.num_plays)
+        self.move_start = None
+
+    def emit_frame_times(self) -> None:
+        # Rolling frame time percentiles, sent periodically instead of every frame
+        if self.telemetry.filename is None:
+            return
+        now = pygame.time.get_ticks()
+        if now - self.telemetry_frames_time < self.telemetry_frames_interval:
+            return
+        self.telemetry_frames_time = now
+        percentiles = {phase: [round(value, 3) for value in self.frame_profiler.get_percentiles(phase)]
+                       for phase in self.frame_profiler.phases + ("frame",)}
+        # The metrics are estimates, only their maximum over the window is sent
+        for metric in self.frame_profiler.metrics:
+            value = self.frame_profiler.get_max(metric)
+            percentiles[metric] = round(value, 3) if value is not None else None
+        self.telemetry.emit("frames", state=self.game_state.name, size=self.board.cols if self.board is not None else 0,
+                            fps=round(self.clock.get_fps(), 1), **percentiles)
+
+    def shutdown(self) -> None:
+        self.worker.shutdown(cancel_futures=True)
+        self.audio_loader.shutdown(cancel_futures=True)
+        self.frame_profiler.close()
+        self.telemetry.close()
+        if self.score_store is not None:
+            self.score_store.close()
+        pygame.quit()
 
     def run(self) -> None:
         # Load high scores and preferences
-        for name in ("high_scores", "preferences"):
-            filename = getattr(self, f"{name}_filename")
-            schema = getattr(self, f"{name}_schema")
-            data = dict()
+        with self.profile("load files"):
+            self.load_high_scores()
             try:
-                with open(filename, 'r') as file:
+                with open(self.preferences_filename, 'r') as file:
                     try:
-                        data = json.load(file)
-                        try:
-                            jsonschema.validate(data, schema)
-                        except jsonschema.ValidationError:
-                            print(f"ERROR: In file {filename}: json doesn't conform to schema.")
+                        self.preferences = json.load(file)
                     except json.JSONDecodeError:
-                        print(f"ERROR: In file {filename}: json not valid.")
+                        print(f"ERROR: In file {self.preferences_filename}: json not valid.")
             except FileNotFoundError:
                 pass
-            setattr(self, name, data)
-
-        pygame.init()
-        pygame.mixer.init()
-        self.font = pygame.font.SysFont("monospace", int(self.font_size))
-        self.font.set_bold(True)
-        self.clock = pygame.time.Clock()
-        icon = pygame.image.load("icon32x32.png")
-        pygame.display.set_icon(icon)
-        pygame.display.set_caption("MATCH3PY")
-        os.environ['SDL_VIDEO_CENTERED'] = '1'
-        display_info = pygame.display.Info()
-        self.screen_surf = pygame.display.set_mode((display_info.current_w, display_info.current_h), self.flags, vsync=1)
-        self.resize_surfaces()
-        self.update_screen()
+            if self.replay_filename is not None:
+                try:
+                    # Checked by the replay engine, a log of an unsupported board can't be played
+                    self.replay = Match3Replay(Match3MoveLog.load(self.replay_filename)).log
+                except (OSError, Match3ReplayError) as e:
+                    print(f"ERROR: In file {self.replay_filename}: {e}")
+
+        with self.profile("init pygame"):
+            self.audio.pre_init()
+            pygame.init()
+            pygame.mixer.init()
+            self.audio.init()
+            self.font = self.get_font(int(self.font_size))
+            self.clock = pygame.time.Clock()
+            icon = pygame.image.load("icon32x32.png")
+            pygame.display.set_icon(icon)
+            pygame.display.set_caption("MATCH3PY")
+
+        with self.profile("open window"):
+            os.environ['SDL_VIDEO_CENTERED'] = '1'
+            display_info = pygame.display.Info()
+            if self.render_size is None:
+                self.screen_surf = pygame.display.set_mode((display_info.current_w, display_info.current_h), self.flags, vsync=1)
+            else:
+                # Draw at a fixed resolution, SDL scales each frame to the whole display when it's presented
+                self.screen_surf = pygame.display.set_mode(self.render_size, self.render_flags, vsync=1)
+            self.telemetry.emit("session_start", resolution=list(self.screen_surf.get_size()),
+                                display=[display_info.current_w, display_info.current_h])
 
-        # Load audio
-        if os.path.isfile(self.background_music_filename):
-            pygame.mixer.music.load(self.background_music_filename)
-        if os.path.isdir(self.sounds_dir):
-            for filename in os.listdir(self.sounds_dir):
-                sound_name = os.path.splitext(filename)[0]
-                self.sounds[sound_name] = pygame.mixer.Sound(f"{self.sounds_dir}/{filename}")
+        # Load audio in the background so the main menu is interactive right away
+        self.audio_loader.submit(self.audio.load)
+
+        with self.profile("first frame"):
+            self.resize_surfaces()
+            self.update_screen()
+        if self.profiler is not None:
+            self.profiler.mark("time to first frame")
+
+        # Play back the replay right away
+        if self.replay is not None:
+            self.replay_time_init = self.time_init
+            self.time_init = self.replay.time_init
+            self.start_game(self.replay.cols, self.replay.seed)
+
+        with self.profile("validate files"):
+            self.validate_files()
+        if self.profiler is not None:
+            print(self.profiler.report())
 
         while True:
-            if self.process_events(fps=self.main_loop_refresh_rate, mouse=True):
-                self.update_screen()
+            # Wait until frame time, or until something happens if the screen is idle
+            events = None
+            timeout = self.idle_timeout()
+            if timeout is None:
+                fps = self.main_loop_refresh_rate
+                if self.animating():
+                    fps = self.ani_fps
+                self.clock.tick(fps)
+            else:
+                self.clock.tick()
+                events = self.wait_events(timeout)
+            self.frame_profiler.end_frame(self.game_state.name, self.board.cols if self.board is not None else 0)
+            self.emit_frame_times()
+
+            with self.frame_phase("events"):
+                redraw = self.process_events(events, mouse=True)
+            if redraw:
+                self.update_screen(keep_widgets=True)
+            if self.resize_pending:
+                continue
 
             if self.game_state == GameState.RUNNING:
-                self.running()
+                with self.frame_phase("logic"):
+                    self.poll_jobs()
+                    self.running()
+                with self.frame_phase("draw"):
+                    self.animate()
+            if self.frame_overlay:
+                self.update_display()
@@ -0,0 +1,138 @@
+import csv
+import importlib
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Match3StartupProfiler:
+    # Imported in this order, so each module is only charged for the dependencies not imported by the previous ones
+    modules = ("pygame", "pygame_widgets", "match3_board", "match3_animation", "match3_gui")
+
+    def __init__(self) -> None:
+        self.time_start = time.perf_counter()
+        self.phases = list()
+        self.marks = list()
+
+    def import_modules(self) -> None:
+        for module in self.modules:
+            with self.phase(f"import {module}"):
+                importlib.import_module(module)
+
+    @contextmanager
+    def phase(self, name: str):
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time_start - self.time_start, time.perf_counter() - time_start))
+
+    def mark(self, name: str) -> None:
+        self.marks.append((name, time.perf_counter() - self.time_start))
+
+    def report(self) -> str:
+        lines = [f"{'Phase':<28}{'Start (ms)':>12}{'Duration (ms)':>15}"]
+        for name, start, duration in self.phases:
+            lines.append(f"{name:<28}{start * 1000:>12.1f}{duration * 1000:>15.1f}")
+        for name, elapsed in self.marks:
+            lines.append(f"{name:<28}{elapsed * 1000:>12.1f}")
+        return "\n".join(lines)
+
+
+class Match3FrameProfiler:
+    phases = ("events", "logic", "draw", "display")
+    # Other values sampled during a frame, only the worst one of each frame is kept
+    # They are estimates computed by the game, not measured, so only their maximum is reported, not percentiles
+    metrics = ("audio_latency_estimate",)
+    percentiles = (50, 95, 99)
+
+    def __init__(self, window: int = 300, filename: str = None) -> None:
+        # Rolling window of the last frames, the frame total is kept as one more phase
+        self.samples = {phase: deque(maxlen=window) for phase in self.phases + ("frame",) + self.metrics}
+        self.times = dict.fromkeys(self.phases, 0)
+        self.values = dict.fromkeys(self.metrics)
+        self.stack = list()
+        self.time_mark = 0
+        self.num_frames = 0
+        self.file = None
+        self.writer = None
+        if filename is not None:
+            self.file = open(filename, 'w', newline='')
+            if filename.endswith(".csv"):
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(("frame", "state", "size") + self.phases + ("frame_time",) + self.metrics)
+
+    @contextmanager
+    def phase(self, name: str):
+        # Nested phases are not charged to the enclosing one, e.g. the display update done while drawing
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def begin(self, name: str) -> None:
+        now = time.perf_counter()
+        if len(self.stack) > 0:
+            self.times[self.stack[-1]] += now - self.time_mark
+        self.stack.append(name)
+        self.time_mark = now
+
+    def end(self) -> None:
+        now = time.perf_counter()
+        self.times[self.stack.pop()] += now - self.time_mark
+        self.time_mark = now
+
+    def record(self, metric: str, value: float) -> None:
+        # The value is in ms, unlike the phase times
+        if self.values[metric] is None or value > self.values[metric]:
+            self.values[metric] = value
+
+    def end_frame(self, state: str, size: int) -> None:
+        frame_time = sum(self.times.values())
+        for phase in self.phases:
+            self.samples[phase].append(self.times[phase])
+        self.samples["frame"].append(frame_time)
+        for metric in self.metrics:
+            if self.values[metric] is not None:
+                self.samples[metric].append(self.values[metric] / 1000)
+        self.num_frames += 1
+        if self.file is not None:
+            times = [round(self.times[phase] * 1000, 3) for phase in self.phases] + [round(frame_time * 1000, 3)]
+            values = [round(self.values[metric], 3) if self.values[metric] is not None else None for metric in self.metrics]
+            if self.writer is not None:
+                self.writer.writerow([self.num_frames, state, size] + times + ["" if value is None else value for value in values])
+            else:
+                columns = self.phases + ("frame_time",) + self.metrics
+                row = dict(frame=self.num_frames, state=state, size=size, **dict(zip(columns, times + values)))
+                self.file.write(json.dumps(row) + "\n")
+        self.times = dict.fromkeys(self.phases, 0)
+        self.values = dict.fromkeys(self.metrics)
+
+    def get_percentiles(self, phase: str) -> tuple[float, ...]:
+        samples = sorted(self.samples[phase])
+        if len(samples) == 0:
+            return tuple(0 for _ in self.percentiles)
+        return tuple(samples[min(len(samples) * p // 100, len(samples) - 1)] * 1000 for p in self.percentiles)
+
+    def get_max(self, metric: str) -> float:
+        if len(self.samples[metric]) == 0:
+            return None
+        return max(self.samples[metric]) * 1000
+
+    def report(self) -> list[str]:
+        names = self.phases + ("frame",)
+        metrics = tuple([metric for metric in self.metrics if len(self.samples[metric]) > 0])
+        width = max([len(name) for name in names + metrics]) + 1
+        lines = [f"{'ms':<{width}}" + "".join(f"{f'p{p}':>7}" for p in self.percentiles)]
+        for name in names:
+            lines.append(f"{name:<{width}}" + "".join(f"{value:>7.2f}" for value in self.get_percentiles(name)))
+        for metric in metrics:
+            lines.append(f"{metric:<{width}}" + f"{'max':>7}" + f"{self.get_max(metric):>7.2f}")
+        return lines
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
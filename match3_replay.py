@@ -0,0 +1,175 @@
+import argparse
+import struct
+import sys
+import time
+from match3_game import Match3Game
+
+
+class Match3ReplayError(ValueError):
+    pass
+
+
+class Match3MoveLog:
+    # Little endian layout: header, then one record per move with its game time (ms, pauses excluded)
+    magic = b"M3ML"
+    # Version 2: the board is reshuffled instead of regenerated when there is no play left
+    version = 2
+    header = struct.Struct("<4sBBBBQiiI")
+    move = struct.Struct("<IBBBBB")
+    swap_move = 0
+    hint_move = 1
+
+    def __init__(self, cols: int, rows: int, num_values: int, seed: int, time_init: int) -> None:
+        self.cols = cols
+        self.rows = rows
+        self.num_values = num_values
+        self.seed = seed
+        self.time_init = time_init
+        self.score = 0
+        self.moves = list()
+
+    def add_swap(self, time_game: int, point1: tuple[int, int], point2: tuple[int, int]) -> None:
+        self.moves.append((max(time_game, 0), self.swap_move, *point1, *point2))
+
+    def add_hint(self, time_game: int) -> None:
+        self.moves.append((max(time_game, 0), self.hint_move, 0, 0, 0, 0))
+
+    def encode(self) -> bytes:
+        buffer = bytearray(self.header.size + self.move.size * len(self.moves))
+        self.header.pack_into(buffer, 0, self.magic, self.version, self.cols, self.rows, self.num_values, self.seed,
+                              self.time_init, self.score, len(self.moves))
+        for i, move in enumerate(self.moves):
+            self.move.pack_into(buffer, self.header.size + self.move.size * i, *move)
+        return bytes(buffer)
+
+    @classmethod
+    def decode(cls, data) -> "Match3MoveLog":
+        view = memoryview(data)
+        if len(view) < cls.header.size:
+            raise Match3ReplayError("Move log is truncated.")
+        (magic, version, cols, rows, num_values, seed, time_init, score, num_moves) = cls.header.unpack_from(view)
+        if magic != cls.magic:
+            raise Match3ReplayError("Not a Match3 move log.")
+        if version != cls.version:
+            raise Match3ReplayError(f"Unsupported move log version: {version}.")
+        if len(view) != cls.header.size + cls.move.size * num_moves:
+            raise Match3ReplayError("Move log is truncated.")
+        log = cls(cols, rows, num_values, seed, time_init)
+        log.score = score
+        log.moves = list(cls.move.iter_unpack(view[cls.header.size:]))
+        return log
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'wb') as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, filename: str) -> "Match3MoveLog":
+        with open(filename, 'rb') as f:
+            return cls.decode(f.read())
+
+
+class Match3Replay:
+    # Slack allowed for a move made in the frame the time ran out
+    time_tolerance = 100
+
+    def __init__(self, log: Match3MoveLog) -> None:
+        if log.cols != log.rows or log.cols not in Match3Game.board_sizes:
+            raise Match3ReplayError(f"Unsupported board size: {log.cols}x{log.rows}.")
+        if log.num_values != Match3Game.num_values_for_size(log.cols):
+            raise Match3ReplayError(f"Unsupported number of values for a {log.cols}x{log.rows} board: {log.num_values}.")
+        self.log = log
+
+    def run(self) -> dict:
+        # Play the moves back to back, the times are only checked against the time the game had left
+        time_start = time.perf_counter()
+        game = Match3Game(self.log.cols, self.log.time_init, self.log.seed)
+        errors = list()
+        num_cascades = 0
+        for i, (time_game, kind, x1, y1, x2, y2) in enumerate(self.log.moves):
+            time_left = Match3Game.calc_time_left(game.time_init, game.time_score, time_game)
+            if time_left <= -self.time_tolerance:
+                errors.append(f"Move {i} was made {-time_left} ms after the end of the game.")
+            if kind == self.log.hint_move:
+                game.hint()
+            elif kind == self.log.swap_move:
+                num_cascades += game.swap((x1, y1), (x2, y2))["depth"]
+            else:
+                raise Match3ReplayError(f"Move {i} is of an unknown kind: {kind}.")
+        if game.score != self.log.score:
+            errors.append(f"Score is {game.score}, {self.log.score} was recorded.")
+        return {
+            "score": game.score,
+            "recorded_score": self.log.score,
+            "verified": len(errors) == 0,
+            "errors": errors,
+            "moves": len(self.log.moves),
+            "cascades": num_cascades,
+            "regenerations": game.num_regenerations,
+            "elapsed": time.perf_counter() - time_start,
+        }
+
+    @staticmethod
+    def report(result: dict) -> str:
+        lines = [
+            f"Score {result['score']} (recorded {result['recorded_score']}): {'verified' if result['verified'] else 'NOT VERIFIED'}",
+            f"{result['moves']} moves, {result['cascades']} cascades, {result['regenerations']} regenerations in {result['elapsed'] * 1000:.1f} ms",
+        ]
+        lines += [f"ERROR: {error}" for error in result["errors"]]
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay Match3 move logs headless and verify their scores.")
+    parser.add_argument("filenames", nargs="*", metavar="FILE", help="move logs (.m3r)")
+    parser.add_argument("--repeat", type=int, default=1, help="replay each log this many times, e.g. to profile the cascades")
+    parser.add_argument("--db", help="verify the top scores stored in this high scores database")
+    parser.add_argument("--size", help="board size of the high scores to verify, e.g. 7x7")
+    parser.add_argument("--top", type=int, default=5, help="number of top scores to verify")
+    args = parser.parse_args()
+
+    failed = False
+    logs = list()
+    for filename in args.filenames:
+        try:
+            logs.append((filename, Match3MoveLog.load(filename)))
+        except (OSError, Match3ReplayError) as e:
+            print(f"{filename}: {e}")
+            failed = True
+    if args.db is not None:
+        from match3_scores import Match3ScoreStore
+        store = Match3ScoreStore(args.db)
+        sizes = [args.size] if args.size is not None else [f"{n}x{n}" for n in Match3Game.board_sizes]
+        for size in sizes:
+            for (name, score, replay) in store.top_replays(size, args.top):
+                if replay is None:
+                    print(f"{size} {name} {score}: no move log recorded")
+                    continue
+                try:
+                    log = Match3MoveLog.decode(replay)
+                except Match3ReplayError as e:
+                    print(f"{size} {name} {score}: {e}")
+                    continue
+                # Check the log against the score in the high scores, not the one recorded in the log
+                log.score = score
+                logs.append((f"{size} {name} {score}", log))
+        store.close()
+
+    for title, log in logs:
+        try:
+            replay = Match3Replay(log)
+        except Match3ReplayError as e:
+            print(f"{title}: {e}")
+            failed = True
+            continue
+        for _ in range(args.repeat):
+            result = replay.run()
+        print(title)
+        print(Match3Replay.report(result))
+        failed = failed or not result["verified"]
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from match3_game import Match3Game
+
+
+class Match3ScoreStore:
+    # Format of the old high_scores.json file, checked before it's imported
+    json_schema = {
+        "type": "object",
+        "additionalProperties": {
+            "type": "array",
+            "items": {
+                "type": "array",
+                "items": [
+                    {"type": "string", "maxLength": 20},
+                    {"type": "integer", "minimum": 1}
+                ],
+                "additionalProperties": False
+            },
+            "maxItems": 5
+        },
+        "propertyNames": {"enum": [f"{n}x{n}" for n in Match3Game.board_sizes]}
+    }
+    schema = (
+        "CREATE TABLE IF NOT EXISTS scores ("
+        "id INTEGER PRIMARY KEY, size TEXT NOT NULL, name TEXT NOT NULL, score INTEGER NOT NULL, time REAL NOT NULL, "
+        "replay BLOB)",
+        "CREATE INDEX IF NOT EXISTS scores_size_score ON scores (size, score DESC, id)",
+    )
+
+    def __init__(self, filename: str = "high_scores.db") -> None:
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        # Every write is a single transaction, the write-ahead log keeps the file consistent if the game crashes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            for statement in self.schema:
+                self.connection.execute(statement)
+            # Databases created before the move logs were recorded
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(scores)")]
+            if "replay" not in columns:
+                self.connection.execute("ALTER TABLE scores ADD COLUMN replay BLOB")
+
+    def add(self, size: str, name: str, score: int, replay: bytes = None) -> None:
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO scores (size, name, score, time, replay) VALUES (?, ?, ?, ?, ?)",
+                (size, name, score, time.time(), replay)
+            )
+
+    def top(self, size: str, n: int = 5) -> list[list]:
+        # Same order as the old high scores list: highest score first, the oldest one first on a tie
+        rows = self.connection.execute(
+            "SELECT name, score FROM scores WHERE size = ? ORDER BY score DESC, id LIMIT ?", (size, n)
+        )
+        return [list(row) for row in rows]
+
+    def top_replays(self, size: str, n: int = 5) -> list[tuple]:
+        # The move logs of the top scores, to verify them
+        return self.connection.execute(
+            "SELECT name, score, replay FROM scores WHERE size = ? ORDER BY score DESC, id LIMIT ?", (size, n)
+        ).fetchall()
+
+    def count(self, size: str = None) -> int:
+        if size is None:
+            return self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM scores WHERE size = ?", (size,)).fetchone()[0]
+
+    @classmethod
+    def validate_json(cls, high_scores) -> None:
+        # Raises jsonschema.ValidationError, jsonschema is only imported when there is a file to import
+        import jsonschema
+        jsonschema.validate(high_scores, cls.json_schema)
+
+    def import_scores(self, high_scores: dict) -> int:
+        # Import the high scores in the format of the old high_scores.json file: {"5x5": [[name, score], ...], ...}
+        rows = [(size, name, score, time.time()) for size, scores in high_scores.items() for (name, score) in scores]
+        with self.connection:
+            self.connection.executemany("INSERT INTO scores (size, name, score, time) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Match3 high scores store.")
+    parser.add_argument("--db", default="high_scores.db", help="high scores database")
+    parser.add_argument("--import", dest="import_filename", metavar="FILE", help="import a high_scores.json file")
+    parser.add_argument("--size", help="list the top scores of this board size, e.g. 5x5")
+    parser.add_argument("--top", type=int, default=5, help="number of top scores to list")
+    args = parser.parse_args()
+
+    high_scores = None
+    if args.import_filename is not None:
+        import jsonschema
+        try:
+            with open(args.import_filename, 'r') as f:
+                high_scores = json.load(f)
+            Match3ScoreStore.validate_json(high_scores)
+        except OSError as e:
+            print(f"ERROR: Couldn't read {args.import_filename}: {e}")
+            sys.exit(1)
+        except json.JSONDecodeError:
+            print(f"ERROR: In file {args.import_filename}: json not valid.")
+            sys.exit(1)
+        except jsonschema.ValidationError:
+            print(f"ERROR: In file {args.import_filename}: json doesn't conform to schema.")
+            sys.exit(1)
+
+    store = Match3ScoreStore(args.db)
+    if high_scores is not None:
+        print(f"Imported {store.import_scores(high_scores)} scores.")
+    if args.size is not None:
+        for i, (name, score) in enumerate(store.top(args.size, args.top)):
+            print(f"{i + 1:>4} {name:<16} {score:>5}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from match3_game import Match3Game
+from match3_snapshot import Match3Snapshot, Match3SnapshotError
+
+
+class Match3ServerError(Exception):
+    pass
+
+
+class Match3Server:
+    max_games_per_client = 16
+    # The times are saved as 32-bit integers in the snapshots the games are sent to the workers as
+    max_time = 2**31 - 1
+
+    def __init__(self, workers: int = None) -> None:
+        self.workers = workers
+        self.pool = None
+        self.games = dict()
+        self.num_clients = 0
+
+    ##################################################
+    # Worker jobs
+    ##################################################
+
+    # Run in the worker processes, the games are sent back and forth as snapshots
+    # Each board has its own random generator, saved in the snapshot, so a game doesn't depend on which worker runs it
+
+    @staticmethod
+    def new_game_job(size: int, time_init: int, seed: int) -> bytes:
+        return Match3Snapshot.encode(Match3Game(size, time_init, seed))
+
+    @staticmethod
+    def swap_job(snapshot: bytes, point1: tuple[int, int], point2: tuple[int, int]) -> tuple[bytes, dict]:
+        game = Match3Snapshot.decode(snapshot)
+        result = game.swap(point1, point2)
+        return (Match3Snapshot.encode(game), result)
+
+    async def run_job(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    ##################################################
+    # Commands
+    ##################################################
+
+    def get_game(self, request: dict, games: set) -> Match3Game:
+        game_id = request.get("game")
+        if game_id not in games:
+            raise Match3ServerError(f"Unknown game: {game_id}.")
+        return self.games[game_id]
+
+    @staticmethod
+    def get_point(request: dict, key: str) -> tuple[int, int]:
+        point = request.get(key)
+        if type(point) != list or len(point) != 2 or not all([type(value) == int for value in point]):
+            raise Match3ServerError(f"'{key}' must be a [col, row] pair.")
+        return tuple(point)
+
+    async def new_command(self, request: dict, games: set) -> dict:
+        if len(games) >= self.max_games_per_client:
+            raise Match3ServerError(f"Maximum number of games per client is {self.max_games_per_client}.")
+        size = request.get("size", 7)
+        time_init = request.get("time", Match3Game.time_init)
+        if type(size) != int or size not in Match3Game.board_sizes:
+            raise Match3ServerError(f"Board size must be between {Match3Game.board_sizes[0]} and {Match3Game.board_sizes[-1]}.")
+        if type(time_init) != int or time_init <= 0 or time_init > self.max_time:
+            raise Match3ServerError(f"'time' must be a positive number of milliseconds, up to {self.max_time}.")
+        game = Match3Snapshot.decode(await self.run_job(self.new_game_job, size, time_init, random.getrandbits(64)))
+        # The timer starts when the game is handed to the client
+        game.time_start = game.now()
+        game_id = uuid.uuid4().hex
+        self.games[game_id] = game
+        games.add(game_id)
+        return {"game": game_id, "state": game.get_state()}
+
+    async def swap_command(self, request: dict, games: set) -> dict:
+        game = self.get_game(request, games)
+        point1 = self.get_point(request, "from")
+        point2 = self.get_point(request, "to")
+        if game.is_over():
+            raise Match3ServerError("Game over.")
+        (snapshot, result) = await self.run_job(self.swap_job, Match3Snapshot.encode(game), point1, point2)
+        # The timer keeps running on the server while the worker resolves the move
+        time_start = game.time_start
+        game = Match3Snapshot.decode(snapshot)
+        game.time_start = time_start
+        self.games[request["game"]] = game
+        return dict(result, state=game.get_state())
+
+    async def hint_command(self, request: dict, games: set) -> dict:
+        game = self.get_game(request, games)
+        if game.is_over():
+            raise Match3ServerError("Game over.")
+        return {"swap": game.hint(), "state": game.get_state()}
+
+    async def state_command(self, request: dict, games: set) -> dict:
+        game = self.get_game(request, games)
+        return {"state": game.get_state()}
+
+    async def end_command(self, request: dict, games: set) -> dict:
+        game = self.get_game(request, games)
+        games.remove(request["game"])
+        del self.games[request["game"]]
+        return {"state": game.get_state()}
+
+    ##################################################
+    # Connections
+    ##################################################
+
+    async def handle_request(self, line: bytes, games: set) -> dict:
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                raise Match3ServerError("Request is not valid json.")
+            if type(request) != dict:
+                raise Match3ServerError("Request must be a json object.")
+            request_id = request.get("id")
+            func = getattr(self, f"{request.get('cmd')}_command", None)
+            if func is None:
+                raise Match3ServerError(f"Unknown command: {request.get('cmd')}.")
+            response = dict(ok=True, **await func(request, games))
+        except (Match3ServerError, Match3SnapshotError, RuntimeError) as e:
+            response = {"ok": False, "error": str(e)}
+        except Exception as e:
+            # A bug in a command or a worker job fails the request only, the connection and its games are kept
+            response = {"ok": False, "error": f"Internal error: {type(e).__name__}: {e}"}
+        if request_id is not None:
+            response["id"] = request_id
+        return response
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # The games belong to the connection, its requests are handled in order so a game is never used concurrently
+        games = set()
+        self.num_clients += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(b'{"ok": false, "error": "Request too long."}\n')
+                    break
+                if len(line) == 0:
+                    break
+                if len(line.strip()) == 0:
+                    continue
+                response = await self.handle_request(line, games)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.num_clients -= 1
+            for game_id in games:
+                del self.games[game_id]
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, path: str = None) -> None:
+        # Forked workers would inherit the sockets of the clients connected at that time and keep them open
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.handle_client, path)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port)
+            print(f"Listening on {path if path is not None else f'{host}:{port}'}")
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless Match3 game server, one JSON request/response per line.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a UNIX socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    server = Match3Server(args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
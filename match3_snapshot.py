@@ -0,0 +1,106 @@
+import random
+import struct
+from match3_board import Match3Board
+from match3_game import Match3Game
+
+
+class Match3SnapshotError(ValueError):
+    pass
+
+
+class Match3Snapshot:
+    # Little endian layout: header, game state, board cells (one signed byte each, row by row), random generator state
+    magic = b"M3SN"
+    version = 1
+    header = struct.Struct("<4sBBBB")
+    game = struct.Struct("<qiiiIIIB")
+    rng = struct.Struct("<625I?d")
+
+    @classmethod
+    def get_size(cls, cols: int, rows: int) -> int:
+        return cls.header.size + cls.game.size + cols * rows + cls.rng.size
+
+    ##################################################
+    # Encode
+    ##################################################
+
+    @classmethod
+    def encode(cls, game: Match3Game) -> bytes:
+        board = game.board
+        buffer = bytearray(cls.get_size(board.cols, board.rows))
+        try:
+            cls.header.pack_into(buffer, 0, cls.magic, cls.version, board.cols, board.rows, len(board.values))
+            offset = cls.header.size
+            # The time left is saved instead of the start time, the timer is paused while the game is suspended
+            cls.game.pack_into(buffer, offset, game.score, game.get_time_left(), game.time_score, game.time_init,
+                               game.num_moves, game.num_hints, game.num_regenerations, game.hint_cut_score)
+            offset += cls.game.size
+            cls.encode_board(board, buffer, offset)
+        except struct.error as e:
+            raise Match3SnapshotError(f"Game can't be saved, a value is out of range: {e}.")
+        return bytes(buffer)
+
+    @classmethod
+    def encode_board(cls, board: Match3Board, buffer: bytearray, offset: int) -> None:
+        num_cells = board.cols * board.rows
+        struct.pack_into(f"<{num_cells}b", buffer, offset, *[value for row in board.board for value in row])
+        (_, internal_state, gauss_next) = board.random.getstate()
+        cls.rng.pack_into(buffer, offset + num_cells, *internal_state, gauss_next is not None,
+                          gauss_next if gauss_next is not None else 0.0)
+
+    ##################################################
+    # Decode
+    ##################################################
+
+    @classmethod
+    def decode(cls, data) -> Match3Game:
+        view = memoryview(data)
+        if len(view) < cls.header.size:
+            raise Match3SnapshotError("Snapshot is truncated.")
+        (magic, version, cols, rows, num_values) = cls.header.unpack_from(view)
+        if magic != cls.magic:
+            raise Match3SnapshotError("Not a Match3 snapshot.")
+        if version != cls.version:
+            raise Match3SnapshotError(f"Unsupported snapshot version: {version}.")
+        if cols != rows or cols not in Match3Game.board_sizes:
+            raise Match3SnapshotError(f"Unsupported board size: {cols}x{rows}.")
+        # Same limits as the Match3Board constructor
+        if num_values < 2 or num_values**2 >= cols * rows:
+            raise Match3SnapshotError(f"Unsupported number of values for a {cols}x{rows} board: {num_values}.")
+        if len(view) != cls.get_size(cols, rows):
+            raise Match3SnapshotError("Snapshot is truncated.")
+        offset = cls.header.size
+        (score, time_left, time_score, time_init, num_moves, num_hints, num_regenerations,
+         hint_cut_score) = cls.game.unpack_from(view, offset)
+        offset += cls.game.size
+        # The snapshot is restored as is, without running the constructors that would generate a new board
+        game = Match3Game.__new__(Match3Game)
+        game.size = cols
+        game.board = cls.decode_board(view, offset, cols, rows, num_values)
+        game.score = score
+        game.time_score = time_score
+        game.time_init = time_init
+        game.time_start = game.now() - (time_init + time_score - time_left)
+        game.hint_cut_score = bool(hint_cut_score)
+        game.num_moves = num_moves
+        game.num_hints = num_hints
+        game.num_regenerations = num_regenerations
+        return game
+
+    @classmethod
+    def decode_board(cls, view: memoryview, offset: int, cols: int, rows: int, num_values: int) -> Match3Board:
+        board = Match3Board.__new__(Match3Board)
+        board.cols = cols
+        board.rows = rows
+        board.values = tuple([i for i in range(num_values)])
+        # The cells are read through a view of the snapshot buffer, without copying the rest of it. They can't stay in
+        # the buffer: the board rows are python lists changed in place and copied with row[:], so each row is copied
+        # into a list (at most 27 bytes per row).
+        cells = view[offset:offset + cols * rows].cast('b')
+        if any(value < 0 or value >= num_values for value in cells):
+            raise Match3SnapshotError("Snapshot has cells with values out of range.")
+        board.board = [cells[row * cols:(row + 1) * cols].tolist() for row in range(rows)]
+        state = cls.rng.unpack_from(view, offset + cols * rows)
+        board.random = random.Random()
+        board.random.setstate((3, state[:625], state[626] if state[625] else None))
+        return board
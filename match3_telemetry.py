@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class Match3Telemetry:
+    def __init__(self, filename: str = None, buffer_size: int = 4096, max_bytes: int = 8 * 1024 * 1024,
+                 backup_count: int = 5, flush_interval: float = 1.0) -> None:
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.session = uuid.uuid4().hex
+        # Ring buffer between the game and the writer thread, the oldest events are dropped when it's full
+        self.events = deque(maxlen=buffer_size)
+        self.num_dropped = 0
+        self.num_dropped_written = 0
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.file = None
+        self.thread = None
+        if filename is not None:
+            self.thread = threading.Thread(target=self.write_events, name="telemetry", daemon=True)
+            self.thread.start()
+
+    ##################################################
+    # Game thread
+    ##################################################
+
+    def emit(self, event: str, **data) -> None:
+        # Never blocks: the events are serialized and written by the writer thread
+        if self.thread is None:
+            return
+        if len(self.events) == self.events.maxlen:
+            self.num_dropped += 1
+        self.events.append(dict(time=round(time.time(), 3), session=self.session, event=event, **data))
+        if len(self.events) >= self.events.maxlen // 2:
+            self.wakeup.set()
+
+    def close(self) -> None:
+        if self.thread is None:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.thread = None
+
+    ##################################################
+    # Writer thread
+    ##################################################
+
+    def write_events(self) -> None:
+        self.file = open(self.filename, 'a')
+        try:
+            while not self.stopping:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                self.drain()
+            self.drain()
+        finally:
+            self.file.close()
+
+    def drain(self) -> None:
+        # Only this thread pops from the buffer, so it can't be emptied between the check and the pop
+        lines = list()
+        while len(self.events) > 0:
+            lines.append(json.dumps(self.events.popleft()) + "\n")
+        num_dropped = self.num_dropped
+        if num_dropped > self.num_dropped_written:
+            row = dict(time=round(time.time(), 3), session=self.session, event="dropped",
+                       count=num_dropped - self.num_dropped_written)
+            lines.append(json.dumps(row) + "\n")
+            self.num_dropped_written = num_dropped
+        if len(lines) == 0:
+            return
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+        self.file.writelines(lines)
+        self.file.flush()
+
+    def rotate(self) -> None:
+        # telemetry.jsonl -> telemetry.jsonl.1 -> ... -> telemetry.jsonl.<backup_count>, the last one is discarded
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.isfile(f"{self.filename}.{i}"):
+                os.replace(f"{self.filename}.{i}", f"{self.filename}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.filename, f"{self.filename}.1")
+        else:
+            os.remove(self.filename)
+        self.file = open(self.filename, 'a')
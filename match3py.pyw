@@ -1,8 +1,30 @@
-from match3_gui import Match3GUI
+import argparse
 
 
 def main():
-    gui = Match3GUI()
+    parser = argparse.ArgumentParser(description="Match 3 game made in Python.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the import and initialization times up to the first frame")
+    parser.add_argument("--frame-times", metavar="FILE",
+                        help="export the time spent in each phase of every frame to a .csv or .jsonl file")
+    parser.add_argument("--render-size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="draw the game at this resolution (640x480 at least) and scale it to the display")
+    parser.add_argument("--telemetry", metavar="FILE",
+                        help="write gameplay and frame time events to this .jsonl file, rotated when it grows too large")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back a move log (.m3r) recorded in the replays directory")
+    parser.add_argument("--audio-buffer", type=int, metavar="SAMPLES",
+                        help="mixer buffer size, smaller values lower the latency of the sound effects (default: 256)")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile_startup:
+        from match3_profile import Match3StartupProfiler
+        profiler = Match3StartupProfiler()
+        profiler.import_modules()
+
+    from match3_gui import Match3GUI
+    gui = Match3GUI(profiler, args.frame_times, args.render_size, args.telemetry, args.replay, args.audio_buffer)
     gui.run()
 
 
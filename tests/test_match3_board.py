@@ -0,0 +1,110 @@
+import pytest
+from match3_board import Match3Board
+
+
+def make_board(rows: list[str]) -> Match3Board:
+    # Board from rows of letters, 'a' is value 0
+    board = Match3Board(len(rows[0]), len(rows), 2, seed=0)
+    board.board = [[ord(c) - ord('a') for c in row] for row in rows]
+    return board
+
+
+def tile_counts(board: Match3Board) -> list[int]:
+    return sorted(value for row in board.board for value in row)
+
+
+def test_count_plays():
+    board = make_board([
+        "abcab",
+        "bcabc",
+        "aabca",
+        "cabab",
+        "bcaca",
+    ])
+    plays = set()
+    for row in range(board.rows):
+        for col in range(board.cols):
+            for neigh in ((col + 1, row), (col, row + 1)):
+                if not board.out_of_bounds(*neigh) and board.is_swap_valid((col, row), neigh):
+                    plays.add(((col, row), neigh))
+    assert board.count_plays() == len(plays)
+    assert board.count_plays() > 0
+
+
+def test_count_plays_dead_board():
+    board = make_board([
+        "abcd",
+        "cdab",
+        "abcd",
+        "cdab",
+    ])
+    assert len(board.find_a_play()) == 0
+    assert board.count_plays() == 0
+
+
+@pytest.mark.parametrize("size,num_values,seed", [(5, 4, 1), (7, 6, 2), (9, 7, 3), (13, 10, 4)])
+def test_reshuffle(size, num_values, seed):
+    board = Match3Board(size, size, num_values, seed)
+    before = [row[:] for row in board.board]
+    moves = board.reshuffle()
+    assert len(moves) > 0
+    # Same tiles, no match3 group and at least one play
+    assert tile_counts(board) == sorted(value for row in before for value in row)
+    assert len(board.get_valid_groups()) == 0
+    assert board.count_plays() > 0
+    # The moves take each tile from its old cell to its new one, every moved cell is a source and a destination once
+    for (src, dst) in moves:
+        assert src != dst
+        assert board.board[dst[1]][dst[0]] == before[src[1]][src[0]]
+    assert sorted(src for (src, _) in moves) == sorted(dst for (_, dst) in moves)
+    for row in range(size):
+        for col in range(size):
+            if (col, row) not in [dst for (_, dst) in moves]:
+                assert board.board[row][col] == before[row][col]
+
+
+def test_reshuffle_impossible():
+    # Any arrangement of 8 tiles of the same value in a 3x3 board has a match3 group
+    board = make_board([
+        "aaa",
+        "aba",
+        "aaa",
+    ])
+    before = [row[:] for row in board.board]
+    assert board.reshuffle(attempts=10) == []
+    assert board.board == before
+
+
+def test_collapse():
+    board = make_board([
+        "abab",
+        "baba",
+        "abab",
+        "baba",
+    ])
+    gaps = [(0, 1), (0, 2), (2, 3), (3, 0)]
+    board.clear(gaps)
+    before = [row[:] for row in board.board]
+    moves = board.collapse()
+    # The board is full again
+    assert all(value != Match3Board.empty for row in board.board for value in row)
+    num_gaps = [len([p for p in gaps if p[0] == col]) for col in range(board.cols)]
+    dsts = [dst for (_, dst) in moves]
+    assert len(dsts) == len(set(dsts))
+    for ((src_x, src_y), (dst_x, dst_y)) in moves:
+        assert src_x == dst_x
+        assert src_y < dst_y
+        if src_y < 0:
+            # New tiles fill the top of the column, stacked above the board as many rows as there were gaps
+            assert dst_y < num_gaps[dst_x]
+            assert dst_y - src_y == num_gaps[dst_x]
+        else:
+            # The tiles above a gap fall by the number of gaps below them
+            assert board.board[dst_y][dst_x] == before[src_y][src_x]
+            assert dst_y - src_y == len([p for p in gaps if p[0] == src_x and p[1] > src_y])
+    # Every gap is filled by a move, the tiles below all the gaps of their column don't move
+    for col in range(board.cols):
+        column_moves = [dst for dst in dsts if dst[0] == col]
+        lowest_gap = max([y for (x, y) in gaps if x == col], default=-1)
+        assert sorted(y for (_, y) in column_moves) == list(range(lowest_gap + 1))
+    assert [row[1] for row in board.board] == [before[0][1], before[1][1], before[2][1], before[3][1]]
@@ -0,0 +1,44 @@
+import os
+
+# The dummy drivers must be selected before pygame is initialized
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import glob
+import pytest
+
+pygame = pytest.importorskip("pygame")
+pytest.importorskip("pygame_widgets")
+
+from match3_bench import Match3Bench
+from match3_game import Match3Game
+from match3_gui import GameState, Match3GUI
+from match3_replay import Match3MoveLog, Match3Replay
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_no_swap_after_time_up(tmp_path, monkeypatch):
+    # Play a short scripted game with hints, as the benchmark does, and record its move log
+    monkeypatch.chdir(repo_dir)
+    bench = Match3Bench(frames=3000, size=9, seed=3, game_time=10, render_size=(1024, 768))
+    bench.gui.replays_dir = str(tmp_path)
+    bench.run()
+    assert bench.gui.game_state == GameState.ENDED
+
+    (filename,) = glob.glob(f"{tmp_path}/*.m3r")
+    log = Match3MoveLog.load(filename)
+    assert len(log.moves) > 0
+    # Every move was made while there was time left, the log verifies without the tolerance of the replay
+    replay = Match3Replay(log)
+    replay.time_tolerance = 0
+    result = replay.run()
+    assert result["verified"], result["errors"]
+    assert result["score"] == bench.gui.score
+
+
+def test_board_locked_when_time_is_up():
+    gui = Match3GUI()
+    assert not gui.board_locked()
+    gui.game_ended = True
+    assert gui.board_locked()
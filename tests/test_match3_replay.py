@@ -0,0 +1,59 @@
+import pytest
+from match3_game import Match3Game
+from match3_replay import Match3MoveLog, Match3Replay, Match3ReplayError
+
+
+def record_game(size: int = 7, seed: int = 5, num_moves: int = 10, move_time: int = 1000) -> Match3MoveLog:
+    # Play a game headless and record it the way the GUI does, one move every move_time ms of game time
+    game = Match3Game(size, seed=seed)
+    log = Match3MoveLog(size, size, Match3Game.num_values_for_size(size), seed, game.time_init)
+    for i in range(num_moves):
+        time_game = (i + 1) * move_time
+        if i % 4 == 3:
+            game.hint()
+            log.add_hint(time_game)
+            continue
+        (swap_points, _) = game.board.find_a_play()
+        game.swap(*swap_points)
+        log.add_swap(time_game, *swap_points)
+    log.score = game.score
+    return log
+
+
+def test_move_log_round_trip(tmp_path):
+    log = record_game()
+    filename = tmp_path / "game.m3r"
+    log.save(filename)
+    loaded = Match3MoveLog.load(filename)
+    for attr in ("cols", "rows", "num_values", "seed", "time_init", "score"):
+        assert getattr(loaded, attr) == getattr(log, attr)
+    assert [tuple(move) for move in loaded.moves] == [tuple(move) for move in log.moves]
+
+    result = Match3Replay(loaded).run()
+    assert result["verified"], result["errors"]
+    assert result["score"] == log.score > 0
+    assert result["moves"] == len(log.moves)
+
+
+def test_move_after_end_is_not_verified():
+    log = record_game(num_moves=4)
+    # A last move made well after the time ran out, even counting the extra time earned
+    game_time = log.time_init + 1000000
+    log.moves.append((game_time, log.hint_move, 0, 0, 0, 0))
+    result = Match3Replay(log).run()
+    assert not result["verified"]
+    assert any("after the end of the game" in error for error in result["errors"])
+
+
+def test_wrong_score_is_not_verified():
+    log = record_game(num_moves=4)
+    log.score += 1
+    result = Match3Replay(log).run()
+    assert not result["verified"]
+
+
+def test_unsupported_version():
+    data = bytearray(record_game(num_moves=1).encode())
+    data[4] = 1
+    with pytest.raises(Match3ReplayError):
+        Match3MoveLog.decode(bytes(data))
@@ -0,0 +1,45 @@
+import pytest
+from match3_game import Match3Game
+from match3_snapshot import Match3Snapshot, Match3SnapshotError
+
+
+def play(game: Match3Game, num_moves: int) -> None:
+    for _ in range(num_moves):
+        (swap_points, _) = game.board.find_a_play()
+        game.swap(*swap_points)
+
+
+@pytest.mark.parametrize("size", [5, 9, 13])
+def test_snapshot_round_trip(size):
+    game = Match3Game(size, 30000, seed=size)
+    play(game, 5)
+    game.hint()
+    # Also save the cached value of the generator's gauss()
+    game.board.random.gauss(0, 1)
+    restored = Match3Snapshot.decode(Match3Snapshot.encode(game))
+
+    assert restored.size == game.size
+    assert restored.board.board == game.board.board
+    assert restored.board.values == game.board.values
+    assert restored.board.random.getstate() == game.board.random.getstate()
+    for attr in ("score", "time_score", "time_init", "hint_cut_score", "num_moves", "num_hints", "num_regenerations"):
+        assert getattr(restored, attr) == getattr(game, attr)
+    assert abs(restored.get_time_left() - game.get_time_left()) <= 10
+
+    # Both games refill the board with the same tiles
+    (swap_points, _) = game.board.find_a_play()
+    assert restored.swap(*swap_points) == game.swap(*swap_points)
+    assert restored.board.board == game.board.board
+    assert restored.score == game.score
+
+
+def test_snapshot_rejects_bad_data():
+    data = Match3Snapshot.encode(Match3Game(7, seed=1))
+    with pytest.raises(Match3SnapshotError):
+        Match3Snapshot.decode(data[:-1])
+    with pytest.raises(Match3SnapshotError):
+        Match3Snapshot.decode(b"XXXX" + data[4:])
+    cells = bytearray(data)
+    cells[Match3Snapshot.header.size + Match3Snapshot.game.size] = 100
+    with pytest.raises(Match3SnapshotError):
+        Match3Snapshot.decode(bytes(cells))